@@ -24,9 +24,23 @@ else
     echo "НЕ РАБОТАЕТ"
 fi
 
+echo -n "Загрузка логов: "
+if pgrep -f "ingest_squid_logs --follow" > /dev/null; then
+    echo "РАБОТАЕТ"
+    DJANGO_SETTINGS_MODULE=squid_monitor.settings python3 -c "
+import django; django.setup()
+from django.core.cache import cache
+m = cache.get('ingest_metrics')
+if m:
+    print(f\"  Отставание: {m['lag_seconds']:.0f} сек, не загружено: {m['backlog_bytes']} байт, скорость: {m['rows_per_sec']:.0f} строк/сек\")
+" 2>/dev/null
+else
+    echo "НЕ РАБОТАЕТ"
+fi
+
 # Проверка Gunicorn
 echo -n "Gunicorn: "
-if pgrep -f "gunicorn squid_monitor.wsgi" > /dev/null; then
+if pgrep -f "gunicorn squid_monitor.asgi" > /dev/null; then
     echo "РАБОТАЕТ"
 else
     echo "НЕ РАБОТАЕТ"
@@ -42,7 +56,7 @@ fi
 
 # Проверка кэша
 echo -n "Кэш: "
-if python3 -c "from django.core.cache import cache; print('OK' if cache.get('squid_log_entries_day') else 'ПУСТО')" 2>/dev/null | grep "OK" > /dev/null; then
+if python3 -c "from django.core.cache import cache; print('OK' if cache.get('snapshot:dashboard:day') else 'ПУСТО')" 2>/dev/null | grep "OK" > /dev/null; then
     echo "ЗАПОЛНЕН"
 else
     echo "ПУСТ (запустите ./update_cache.sh)"
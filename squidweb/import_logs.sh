@@ -2,8 +2,12 @@
 cd /squidweb
 source venv/bin/activate
 
-# Импорт новых логов
-python3 manage.py import_squid_logs
+# Импорт новых логов; если установлен сервис непрерывной загрузки, лог загружает он
+if systemctl is-enabled --quiet squid-monitor-ingest.service 2>/dev/null; then
+    echo "Лог загружает сервис squid-monitor-ingest, импорт пропущен"
+else
+    python3 manage.py import_squid_logs
+fi
 
 # Очистка старых логов каждые 6 часов
 current_hour=$(date +%H)
@@ -8,11 +8,13 @@ APP_PATH=$(pwd)
 sed -i "s|/path/to/squidweb|$APP_PATH|g" systemd/squid-monitor.service
 sed -i "s|/path/to/squidweb|$APP_PATH|g" systemd/squid-monitor-celery.service
 sed -i "s|/path/to/squidweb|$APP_PATH|g" systemd/squid-monitor-celerybeat.service
+sed -i "s|/path/to/squidweb|$APP_PATH|g" systemd/squid-monitor-ingest.service
 
 # Копируем файлы сервисов в systemd
 sudo cp systemd/squid-monitor.service /etc/systemd/system/
 sudo cp systemd/squid-monitor-celery.service /etc/systemd/system/
 sudo cp systemd/squid-monitor-celerybeat.service /etc/systemd/system/
+sudo cp systemd/squid-monitor-ingest.service /etc/systemd/system/
 
 # Перезагружаем systemd
 sudo systemctl daemon-reload
@@ -21,9 +23,11 @@ sudo systemctl daemon-reload
 sudo systemctl enable squid-monitor.service
 sudo systemctl enable squid-monitor-celery.service
 sudo systemctl enable squid-monitor-celerybeat.service
+sudo systemctl enable squid-monitor-ingest.service
 
 sudo systemctl start squid-monitor-celery.service
 sudo systemctl start squid-monitor-celerybeat.service
+sudo systemctl start squid-monitor-ingest.service
 sudo systemctl start squid-monitor.service
 
 echo "Сервисы установлены и запущены!"
@@ -31,3 +35,4 @@ echo "Для проверки статуса выполните:"
 echo "sudo systemctl status squid-monitor.service"
 echo "sudo systemctl status squid-monitor-celery.service"
 echo "sudo systemctl status squid-monitor-celerybeat.service"
+echo "sudo systemctl status squid-monitor-ingest.service"
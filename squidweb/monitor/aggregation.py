@@ -0,0 +1,11 @@
+"""Формат статистики, общий для запросов, агрегатов и снимков, и выбор топа.
+
+Статистика по ключу (час, день, домен) - словарь {ключ: {'requests': ..., 'traffic': ...}}:
+его возвращают queries (по сырым записям) и rollups (по агрегатам TrafficRollup),
+снимки (snapshots) хранят его компактно и восстанавливают в том же виде.
+"""
+
+
+def top(stats, n=10):
+    """n ключей с наибольшим числом запросов: [(key, stats), ...] по убыванию"""
+    return sorted(stats.items(), key=lambda item: item[1]['requests'], reverse=True)[:n]
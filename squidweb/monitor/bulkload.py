@@ -0,0 +1,121 @@
+"""Быстрая загрузка строк лога в SquidLog в обход ORM.
+
+Строки передаются кортежами в порядке полей модели (без id). На SQLite - executemany
+одним запросом на пачку с настроенными PRAGMA, на PostgreSQL - COPY FROM STDIN,
+на остальных СУБД - executemany. Для первичной загрузки в пустую таблицу вторичные
+индексы можно удалить и построить заново один раз в конце.
+"""
+import io
+from django.db import connection
+from .models import SquidLog
+
+# PRAGMA для загрузки в SQLite: WAL не блокирует читателей (веб-интерфейс) на время
+# записи, synchronous=NORMAL в режиме WAL не теряет целостность при сбое приложения
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',  # 64 МБ кэша страниц
+]
+
+
+def _copy_value(value):
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class BulkLoader:
+    """Загружает кортежи полей SquidLog пачками напрямую через курсор БД"""
+
+    def __init__(self, model=SquidLog):
+        self.model = model
+        self.fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        self.table = connection.ops.quote_name(model._meta.db_table)
+        self.columns = ', '.join(connection.ops.quote_name(field.column) for field in self.fields)
+        self.dropped_indexes = []
+
+    def prepare(self):
+        """Настраивает соединение для загрузки (PRAGMA на SQLite)"""
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                for pragma in SQLITE_PRAGMAS:
+                    cursor.execute(pragma)
+
+    def _secondary_indexes(self, cursor):
+        """[(имя, SQL создания)] вторичных индексов таблицы, не связанных с ограничениями"""
+        table = self.model._meta.db_table
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+                [table]
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s '
+                'AND indexname NOT IN (SELECT conname FROM pg_constraint)',
+                [table]
+            )
+        else:
+            return []
+        return cursor.fetchall()
+
+    def drop_indexes(self):
+        """Удаляет вторичные индексы перед первичной загрузкой; restore_indexes() строит их заново"""
+        with connection.cursor() as cursor:
+            self.dropped_indexes = self._secondary_indexes(cursor)
+            for name, _ in self.dropped_indexes:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+        return len(self.dropped_indexes)
+
+    def restore_indexes(self):
+        with connection.cursor() as cursor:
+            for _, sql in self.dropped_indexes:
+                cursor.execute(sql)
+        count = len(self.dropped_indexes)
+        self.dropped_indexes = []
+        return count
+
+    def _adapt(self, rows):
+        """Приводит значения к виду, который ожидает драйвер (даты - как в ORM)"""
+        adapt = connection.ops.adapt_datetimefield_value
+        datetime_columns = [i for i, field in enumerate(self.fields) if field.get_internal_type() == 'DateTimeField']
+        for row in rows:
+            row = list(row)
+            for i in datetime_columns:
+                row[i] = adapt(row[i])
+            yield row
+
+    def load(self, rows):
+        """Вставляет строки (внутри текущей транзакции) и возвращает их количество"""
+        if not rows:
+            return 0
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                self._copy(cursor, rows)
+            else:
+                placeholders = ', '.join(['%s'] * len(self.fields))
+                cursor.executemany(
+                    f'INSERT INTO {self.table} ({self.columns}) VALUES ({placeholders})',
+                    list(self._adapt(rows))
+                )
+        return len(rows)
+
+    def _copy(self, cursor, rows):
+        sql = f'COPY {self.table} ({self.columns}) FROM STDIN'
+        if hasattr(cursor, 'copy'):
+            # psycopg 3
+            with cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            # psycopg2
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write('\t'.join(_copy_value(value) for value in row))
+                buffer.write('\n')
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
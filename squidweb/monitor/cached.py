@@ -0,0 +1,121 @@
+"""Кэш для представлений: устаревшее значение отдаётся, пока его обновляют в фоне.
+
+Значение хранится в кэше Django вместе со сроком свежести и живёт в кэше ещё STALE_TTL
+после него. Свежее значение отдаётся сразу. Устаревшее тоже отдаётся сразу, а обновление
+запускается в пуле потоков - одно на все процессы благодаря блокировке (locks). При
+промахе потоки одного процесса ждут одно общее вычисление, а другие процессы - пока
+значение появится в кэше (не дольше WAIT_TIMEOUT, потом считают сами). Срок свежести
+случайно растягивается на ±JITTER, чтобы ключи, записанные вместе, не устаревали разом.
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.core.cache import cache
+from django.db import connections
+from . import locks
+
+STALE_TTL = 3600  # Сколько устаревшее значение ещё можно отдавать
+JITTER = 0.1
+LOCK_TIMEOUT = 120  # Дольше любого вычисления; блокировка упавшего процесса истечёт сама
+WAIT_TIMEOUT = 30
+WAIT_INTERVAL = 0.1
+WORKERS = 4
+
+_executor = None
+_pending = {}  # ключ -> Future вычисления при промахе в этом процессе
+_lock = threading.Lock()
+
+
+def _entry(value, ttl):
+    return value, time.time() + ttl * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def store(key, value, ttl):
+    cache.set(key, _entry(value, ttl), ttl + STALE_TTL)
+
+
+def store_many(values, ttl):
+    """Записывает {ключ: значение} одной операцией кэша"""
+    cache.set_many({key: _entry(value, ttl) for key, value in values.items()}, ttl + STALE_TTL)
+
+
+def _lock_name(key):
+    return 'refresh:' + key
+
+
+def _refresh(key, build, ttl, token):
+    try:
+        store(key, build(), ttl)
+    except Exception as e:
+        print(f"Error refreshing {key}: {e}")
+    finally:
+        locks.release(_lock_name(key), token)
+        # Соединения с базой у каждого потока свои - закрываем соединение потока пула
+        connections.close_all()
+
+
+def _refresh_in_background(key, build, ttl):
+    global _executor
+    token = locks.acquire(_lock_name(key), LOCK_TIMEOUT)
+    if token is None:
+        # Ключ уже обновляет этот или другой процесс
+        return
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='cache-refresh')
+    _executor.submit(_refresh, key, build, ttl, token)
+
+
+def _compute(key, build, ttl):
+    """Вычисляет значение под блокировкой; если её держит другой процесс - ждёт его результат"""
+    token = locks.acquire(_lock_name(key), LOCK_TIMEOUT)
+    if token is None:
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+    try:
+        value = build()
+        store(key, value, ttl)
+        return value
+    finally:
+        if token is not None:
+            locks.release(_lock_name(key), token)
+
+
+def _compute_once(key, build, ttl):
+    """_compute, общий для всех потоков процесса, одновременно промахнувшихся по key"""
+    with _lock:
+        future = _pending.get(key)
+        owner = future is None
+        if owner:
+            future = _pending[key] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        value = _compute(key, build, ttl)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(value)
+        return value
+    finally:
+        with _lock:
+            _pending.pop(key, None)
+
+
+def get(key, build, ttl):
+    """Значение key из кэша; build() вызывается при промахе или в фоне, если значение старше ttl"""
+    entry = cache.get(key)
+    if entry is None:
+        return _compute_once(key, build, ttl)
+
+    value, fresh_until = entry
+    if time.time() >= fresh_until:
+        _refresh_in_background(key, build, ttl)
+    return value
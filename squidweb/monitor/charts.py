@@ -0,0 +1,100 @@
+"""Ряды данных графиков для JSON API, общие для задач и представлений.
+
+Графики рисует plotly.js в браузере (static/js/charts.js), сервер отдаёт только
+компактные ряды: подписи и значения. Тело ответа - JSON, его ключ в кэше и ETag -
+хэш VERSION, вида, периода и самого тела, поэтому одинаковые данные не сериализуются
+дважды, а разные графики не могут получить один ключ. refresh_statistics после
+пересчёта снимков публикует ряды главной страницы всех периодов и удаляет предыдущую
+версию каждого (указатель chart:current:<вид>:<период>) - на ключ ссылается только
+его указатель, так что удаление не задевает другие графики. API отдаёт опубликованное
+тело, не читая снимок. Эта публикация и есть инвалидация: новые записи попадают в
+графики вместе с новыми снимками, а не раньше них, поэтому отдельно сбрасывать
+графики после загрузки логов незачем.
+"""
+import hashlib
+import json
+from django.core.cache import cache
+from .timeutils import to_datetime
+from . import snapshots
+
+KEY_PREFIX = 'chart:'
+CURRENT_PREFIX = 'chart:current:'
+TTL = 24 * 3600
+VERSION = 2  # Увеличить при изменении формата рядов
+KINDS = ('traffic', 'domains')
+TITLES = {'day': 'за последние 24 часа', 'month': 'за последние 30 дней', 'year': 'за последний год'}
+
+
+def series(kind, period, snapshot):
+    """Ряды графика kind ('traffic', 'domains') за period по снимку"""
+    if kind == 'traffic':
+        if period == 'day':
+            points = [(to_datetime(hour).strftime('%H:%M'), stats['traffic'])
+                      for hour, stats in sorted(snapshots.hourly(snapshot).items())]
+        else:
+            points = [(day.strftime('%d.%m'), stats['traffic'])
+                      for day, stats in sorted(snapshots.daily(snapshot).items())]
+        return {
+            'title': f'Объем трафика {TITLES[period]}',
+            'axis': 'Время' if period == 'day' else 'Дата',
+            'labels': [label for label, _ in points],
+            'traffic': [traffic for _, traffic in points],
+        }
+
+    # Топ 10 доменов по запросам, по возрастанию - так их рисует горизонтальный bar
+    top = sorted(snapshots.domains(snapshot).items(), key=lambda item: item[1]['requests'], reverse=True)[:10]
+    top.reverse()
+    return {
+        'title': 'Топ 10 посещаемых доменов',
+        'domains': [domain for domain, _ in top],
+        'requests': [stats['requests'] for _, stats in top],
+        'traffic': [stats['traffic'] for _, stats in top],
+    }
+
+
+def render(kind, period, snapshot):
+    """(ETag, тело JSON) графика по снимку, без сохранения"""
+    body = json.dumps(series(kind, period, snapshot), ensure_ascii=False, separators=(',', ':')).encode()
+    # Вид и период входят в хэш: одинаковые ряды месяца и года не делят один ключ
+    digest = hashlib.sha256(f'{VERSION}:{kind}:{period}:'.encode() + body).hexdigest()
+    return digest, body
+
+
+def current(kind, period):
+    """Опубликованный (ETag, тело) графика главной страницы или None"""
+    digest = cache.get(CURRENT_PREFIX + f'{kind}:{period}')
+    if digest is None:
+        return None
+    body = cache.get(KEY_PREFIX + digest)
+    return None if body is None else (digest, body)
+
+
+def get(kind, period):
+    """(ETag, тело) графика главной страницы: опубликованный или построенный по снимку из кэша"""
+    artifact = current(kind, period)
+    if artifact is None:
+        snapshot = snapshots.get(f'dashboard:{period}', lambda: snapshots.dashboard(period))
+        artifact = render(kind, period, snapshot)
+    return artifact
+
+
+def publish(dashboards):
+    """Публикует ряды по новым снимкам {период: снимок} и удаляет их прежние версии.
+
+    Возвращает число графиков, данные которых изменились.
+    """
+    changed = 0
+    for period, snapshot in dashboards.items():
+        for kind in KINDS:
+            digest, body = render(kind, period, snapshot)
+            pointer = CURRENT_PREFIX + f'{kind}:{period}'
+            previous = cache.get(pointer)
+            if digest != previous:
+                cache.set(KEY_PREFIX + digest, body, TTL)
+                if previous is not None:
+                    cache.delete(KEY_PREFIX + previous)
+                changed += 1
+            # Указатель живёт как снимок: без обновлений API переходит на снимок
+            cache.set(pointer, digest, snapshots.TTL)
+    return changed
+
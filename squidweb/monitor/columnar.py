@@ -0,0 +1,149 @@
+import os
+from array import array
+import numpy as np
+from .domains import url_domain
+
+
+class LogColumns:
+    """Компактное колоночное представление записей лога.
+
+    Числовые поля хранятся в массивах NumPy, строковые - кодами в словарях
+    (clients, methods, domains, cache_results). Сам URL не хранится: почти все URL
+    уникальны, и словарь из них занимал бы больше, чем все остальные колонки; из
+    URL нужен только домен. Записи отсортированы по времени, поэтому срез по
+    периоду - это два searchsorted и view без копирования. Одна запись занимает
+    34 байта в колонках плюс словари, которые растут с числом клиентов и доменов,
+    а не записей.
+    """
+
+    def __init__(self, timestamp, response_time, bytes, status, client, method, domain,
+                 cache_result, clients, methods, domains, cache_results):
+        self.timestamp = timestamp          # float64, epoch
+        self.response_time = response_time  # float32, мс
+        self.bytes = bytes                  # int64
+        self.status = status                # int16
+        self.client = client                # int32, код в clients
+        self.method = method                # int16, код в methods
+        self.domain = domain                # int32, код в domains
+        self.cache_result = cache_result    # int16, код в cache_results
+        self.clients = clients
+        self.methods = methods
+        self.domains = domains
+        self.cache_results = cache_results
+
+    _numeric_fields = ('timestamp', 'response_time', 'bytes', 'status', 'client', 'method',
+                       'domain', 'cache_result')
+    _dictionaries = ('clients', 'methods', 'domains', 'cache_results')
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def _derive(self, index):
+        """Новый набор колонок с теми же словарями по срезу или маске"""
+        return LogColumns(
+            *(getattr(self, name)[index] for name in self._numeric_fields),
+            self.clients, self.methods, self.domains, self.cache_results
+        )
+
+    def slice_time(self, since=None, until=None):
+        """Записи в интервале [since, until] (epoch); возвращает view без копирования"""
+        start = 0 if since is None else np.searchsorted(self.timestamp, since, side='left')
+        stop = len(self) if until is None else np.searchsorted(self.timestamp, until, side='right')
+        return self._derive(slice(start, stop))
+
+    def filter(self, mask):
+        """Записи, для которых mask истинна (копия)"""
+        return self._derive(mask)
+
+    def save(self, path):
+        """Сохраняет колонки в .npz без pickle; запись атомарная (через временный файл).
+
+        Словари хранятся одним блоком UTF-8 со строками через '\\n' (в строках лога
+        перевода строки быть не может) и количеством значений.
+        """
+        arrays = {name: getattr(self, name) for name in self._numeric_fields}
+        for name in self._dictionaries:
+            values = getattr(self, name)
+            arrays[name] = np.frombuffer('\n'.join(values).encode(), dtype=np.uint8)
+            arrays[f'{name}_count'] = np.array([len(values)])
+
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            dictionaries = {}
+            for name in cls._dictionaries:
+                text = data[name].tobytes().decode()
+                dictionaries[name] = text.split('\n') if int(data[f'{name}_count'][0]) else []
+            return cls(*(data[name] for name in cls._numeric_fields), **dictionaries)
+
+class LogColumnsBuilder:
+    """Накапливает разобранные строки лога и собирает из них LogColumns"""
+
+    def __init__(self):
+        self.timestamp = array('d')
+        self.response_time = array('f')
+        self.bytes = array('q')
+        self.status = array('h')
+        self.client = array('i')
+        self.method = array('h')
+        self.domain = array('i')
+        self.cache_result = array('h')
+        self._clients = {}
+        self._methods = {}
+        self._cache_results = {}
+        self._domains = {}
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @staticmethod
+    def _code(mapping, value):
+        code = mapping.get(value)
+        if code is None:
+            code = mapping[value] = len(mapping)
+        return code
+
+    def append(self, timestamp, response_time, client_address, result_code, bytes_sent,
+               request_method, url, cache_result):
+        self.timestamp.append(timestamp)
+        self.response_time.append(response_time)
+        self.bytes.append(bytes_sent)
+        self.status.append(result_code)
+        self.client.append(self._code(self._clients, client_address))
+        self.method.append(self._code(self._methods, request_method))
+        # url_domain кэширует домен по хосту, URL целиком не сохраняется
+        self.domain.append(self._code(self._domains, url_domain(url)))
+        self.cache_result.append(self._code(self._cache_results, cache_result))
+
+    def append_entry(self, entry):
+        self.append(entry['timestamp'], entry['response_time'], entry['client_address'],
+                    entry['result_code'], entry['bytes'], entry['request_method'], entry['url'],
+                    entry['cache_result'])
+
+    def build(self):
+        """Собирает LogColumns, отсортированные по времени"""
+        timestamp = np.frombuffer(self.timestamp, dtype=np.float64)
+        order = np.argsort(timestamp, kind='stable')
+
+        def column(values, dtype):
+            return np.frombuffer(values, dtype=dtype)[order]
+
+        return LogColumns(
+            timestamp=timestamp[order],
+            response_time=column(self.response_time, np.float32),
+            bytes=column(self.bytes, np.int64),
+            status=column(self.status, np.int16),
+            client=column(self.client, np.int32),
+            method=column(self.method, np.int16),
+            domain=column(self.domain, np.int32),
+            cache_result=column(self.cache_result, np.int16),
+            clients=list(self._clients),
+            methods=list(self._methods),
+            domains=list(self._domains),
+            cache_results=list(self._cache_results),
+        )
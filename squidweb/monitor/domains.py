@@ -0,0 +1,94 @@
+"""Домен назначения из URL - один способ для разбора лога, импорта и представлений.
+
+Домен - имя хоста в нижнем регистре без userinfo и порта. У обычных запросов хост
+берётся из URL, у CONNECT squid пишет в поле URL сразу host:port без схемы - для
+обоих случаев результат одинаковый (vk.com:443 и https://vk.com/ - это vk.com).
+
+Разбор выполняется один раз на каждую часть URL до пути: таблица на процесс хранит
+для неё готовую строку домена, одну на все URL этого хоста. Таблица ограничена
+MAX_CACHED_HOSTS и при переполнении очищается - у демона ingest_squid_logs --follow,
+который разбирает лог неделями, память не растёт с числом встреченных хостов.
+Целые коды доменов строит сам LogColumnsBuilder в пределах одного набора колонок.
+
+С SQUID_DOMAIN_FOLDING = True поддомены сворачиваются до регистрируемого домена
+(eTLD+1): img.cdn.vk.com -> vk.com, news.bbc.co.uk -> bbc.co.uk. Если установлен
+пакет tldextract, используется его встроенный список публичных суффиксов, иначе -
+упрощённое правило (последние две метки, три для суффиксов вида co.uk).
+"""
+import ipaddress
+import re
+from django.conf import settings
+
+try:
+    import tldextract
+except ImportError:
+    tldextract = None
+
+UNKNOWN = 'Неизвестно'  # Подпись неизвестного домена (и имени хоста, см. hostnames)
+MAX_CACHED_HOSTS = 100000
+
+# Схема (если есть) и часть URL до пути, запроса или фрагмента
+_AUTHORITY_RE = re.compile(r'(?:[A-Za-z][A-Za-z0-9+.-]*://)?([^/?#]*)')
+
+# Метки второго уровня, под которыми регистрируют домены в национальных зонах (co.uk, com.au)
+_SECOND_LEVEL = {'ac', 'co', 'com', 'edu', 'gov', 'net', 'org', 'msk', 'spb'}
+
+_hosts = {}  # часть URL до пути -> домен
+_folding = None
+_extractor = None
+
+
+def _is_ip(host):
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def registrable_domain(host):
+    """Регистрируемый домен (eTLD+1) для имени хоста; IP-адреса не меняются"""
+    global _extractor
+    if host == UNKNOWN or _is_ip(host):
+        return host
+
+    if tldextract is not None:
+        if _extractor is None:
+            # Только встроенный список суффиксов, без загрузки из сети
+            _extractor = tldextract.TLDExtract(suffix_list_urls=())
+        parts = _extractor(host)
+        if parts.domain and parts.suffix:
+            return f'{parts.domain}.{parts.suffix}'
+        return host
+
+    labels = host.split('.')
+    size = 3 if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL else 2
+    return '.'.join(labels[-size:])
+
+
+def host_domain(authority):
+    """Домен для части URL до пути: host, host:port, user@host, [IPv6]:port"""
+    host = authority.rpartition('@')[2]
+    if host.startswith('['):
+        host = host[1:].partition(']')[0]
+    else:
+        host = host.partition(':')[0]
+    host = host.lower().rstrip('.')
+    if not host:
+        return UNKNOWN
+
+    global _folding
+    if _folding is None:
+        _folding = getattr(settings, 'SQUID_DOMAIN_FOLDING', False)
+    return registrable_domain(host) if _folding else host
+
+
+def url_domain(url):
+    """Домен назначения URL (для CONNECT host:port - тот же домен, что и у https://host/)"""
+    authority = _AUTHORITY_RE.match(url).group(1)
+    domain = _hosts.get(authority)
+    if domain is None:
+        if len(_hosts) >= MAX_CACHED_HOSTS:
+            _hosts.clear()
+        domain = _hosts[authority] = host_domain(authority)
+    return domain
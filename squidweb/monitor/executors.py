@@ -0,0 +1,39 @@
+"""Пул потоков для синхронной работы асинхронных представлений: ORM, кэш, DNS, графики.
+
+Цикл событий воркера не блокируется: медленная страница пользователя занимает поток
+пула, а не весь воркер, и остальные запросы продолжают обслуживаться. Размер пула -
+SQUID_VIEW_WORKERS, он же ограничивает число одновременных запросов к базе из одного
+процесса. После каждого вызова соединения потока с базой закрываются так же, как
+в конце обычного запроса (close_old_connections).
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _executor_instance():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.SQUID_VIEW_WORKERS, thread_name_prefix='view')
+    return _executor
+
+
+def _call(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run(func, *args, **kwargs):
+    """Выполняет func(*args, **kwargs) в пуле и возвращает результат"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor_instance(), functools.partial(_call, func, args, kwargs))
@@ -0,0 +1,92 @@
+"""Имена хостов клиентов (обратное разрешение IP) с кэшем и ограничением времени.
+
+socket.gethostbyaddr блокирует поток до ответа DNS - на медленных PTR это секунды
+на каждый адрес. Поэтому на пути запроса имена берутся из кэша Django (Redis), а
+промахи разрешаются параллельно в общем пуле потоков (SQUID_DNS_WORKERS), и страница
+ждёт их не дольше SQUID_DNS_TIMEOUT. Не успевшие запросы продолжают выполняться в
+пуле и попадают в кэш к следующему показу страницы. Неудачные ответы тоже кэшируются,
+но на меньший срок. Задача refresh_hostnames заранее обновляет имена активных клиентов.
+"""
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.cache import cache
+from .domains import UNKNOWN
+
+KEY_PREFIX = 'hostname:'
+
+_executor = None
+_pending = {}  # ip -> Future выполняющегося разрешения
+_lock = threading.RLock()
+
+
+def _key(ip):
+    return KEY_PREFIX + ip
+
+
+def _resolve(ip):
+    """Разрешает ip и сохраняет результат в кэш; '' - у адреса нет имени"""
+    try:
+        hostname = socket.gethostbyaddr(ip)[0]
+    except (OSError, UnicodeError):
+        hostname = ''
+    ttl = settings.SQUID_DNS_TTL if hostname else settings.SQUID_DNS_NEGATIVE_TTL
+    cache.set(_key(ip), hostname, ttl)
+    return hostname
+
+
+def _forget(ip):
+    with _lock:
+        _pending.pop(ip, None)
+
+
+def _submit(ip):
+    """Future разрешения ip; повторный запрос того же адреса ждёт уже запущенный"""
+    global _executor
+    with _lock:
+        future = _pending.get(ip)
+        if future is None:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.SQUID_DNS_WORKERS, thread_name_prefix='dns')
+            future = _pending[ip] = _executor.submit(_resolve, ip)
+            future.add_done_callback(lambda _, ip=ip: _forget(ip))
+    return future
+
+
+def _result(future):
+    if not future.done() or future.exception() is not None:
+        return ''
+    return future.result()
+
+
+def lookup_many(ips, timeout=None):
+    """{ip: имя хоста} для ips; промахи кэша ждём не дольше timeout (по умолчанию SQUID_DNS_TIMEOUT)"""
+    ips = set(ips)
+    cached = cache.get_many([_key(ip) for ip in ips])
+
+    result = {}
+    futures = {}
+    for ip in ips:
+        hostname = cached.get(_key(ip))
+        if hostname is None:
+            futures[ip] = _submit(ip)
+        else:
+            result[ip] = hostname or UNKNOWN
+
+    if futures:
+        wait(futures.values(), timeout=settings.SQUID_DNS_TIMEOUT if timeout is None else timeout)
+        for ip, future in futures.items():
+            result[ip] = _result(future) or UNKNOWN
+    return result
+
+
+def lookup(ip, timeout=None):
+    return lookup_many([ip], timeout)[ip]
+
+
+def refresh(ips, timeout=60):
+    """Заново разрешает ips и обновляет кэш; возвращает число адресов, получивших имя"""
+    futures = [_submit(ip) for ip in set(ips)]
+    done, _ = wait(futures, timeout=timeout)
+    return sum(1 for future in done if _result(future))
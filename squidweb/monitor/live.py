@@ -0,0 +1,178 @@
+"""Живая лента подключений: один поток на процесс читает новые записи и раздаёт их подписчикам.
+
+Поток (tailer) раз в POLL_INTERVAL запрашивает из базы записи новее последней увиденной,
+один раз разрешает имена хостов и рассылает готовые события в очереди подписчиков -
+SSE-соединений (ConnectionsStreamView) в цикле событий asyncio. Нагрузка на базу и DNS
+не зависит от числа открытых страниц. Поток запускается с первым подписчиком и
+завершается, когда подписчиков не остаётся. Последние BUFFER_SIZE событий хранятся,
+чтобы новый подписчик получил записи, появившиеся между отрисовкой страницы и
+подключением к ленте.
+
+Поток свой у каждого процесса (воркера uvicorn), так что запросов к базе раз в
+POLL_INTERVAL столько, сколько воркеров с открытыми лентами. Записи, не попавшие в
+ленту - больше BATCH_SIZE за опрос или переполненная очередь подписчика, - не
+пропадают молча: подписчик получает событие пропуска {'skipped': число записей}.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from django.db import connections
+from django.template.defaultfilters import date as date_format, filesizeformat
+from django.urls import reverse
+from .timeutils import to_datetime
+from . import hostnames, queries
+
+POLL_INTERVAL = 1.0
+BATCH_SIZE = 100  # Не больше записей за один опрос: ленте нужны последние, остальные - пропуск
+BUFFER_SIZE = 100
+QUEUE_SIZE = 500  # Очередь медленного подписчика: при переполнении события пропускаются
+
+_subscribers = set()
+_recent = deque(maxlen=BUFFER_SIZE)
+_thread = None
+_lock = threading.Lock()
+
+
+class Subscription:
+    """Очередь событий одного подписчика в его цикле событий"""
+
+    def __init__(self, since=0):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.since = since
+        self.dropped = 0  # Записи, не поместившиеся в очередь с прошлого события пропуска
+
+    def _offer(self, event):
+        # Записи не новее since подписчик уже видел на странице
+        if event['timestamp'] <= self.since:
+            return
+        if self.dropped and not self.queue.full():
+            self.queue.put_nowait(skipped_event(self.dropped, event['timestamp']))
+            self.dropped = 0
+        if self.queue.full():
+            self.dropped += event.get('skipped', 1)
+        else:
+            self.queue.put_nowait(event)
+
+    def push(self, event):
+        """Передаёт событие из потока чтения в цикл событий подписчика"""
+        self.loop.call_soon_threadsafe(self._offer, event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+def skipped_event(count, timestamp):
+    """Событие пропуска: count записей старше timestamp не попали в ленту"""
+    return {'timestamp': timestamp, 'skipped': count}
+
+
+def _event(row, names):
+    """Запись лога в формате строки таблицы подключений"""
+    ip = row['client_address']
+    return {
+        'timestamp': row['timestamp'],
+        'time': date_format(to_datetime(row['timestamp']), 'd.m.Y H:i:s'),
+        'ip': ip,
+        'user_url': reverse('user_detail', kwargs={'ip': ip}) if ip else '',
+        'hostname': names.get(ip, ''),
+        'domain': row['domain'],
+        'url': row['url'],
+        'method': row['request_method'],
+        'status': row['result_code'],
+        'size': filesizeformat(row['bytes']),
+    }
+
+
+def _poll(last_timestamp, seen):
+    """Записи новее курсора (время, id записей с этим временем) по возрастанию, число
+    пропущенных записей и новый курсор.
+
+    Берутся последние BATCH_SIZE записей; если новых больше, более старые пропускаются,
+    а их число считается по COUNT - только когда пачка заполнена целиком.
+    """
+    log_rows = queries.LogRows(queries.raw_querysets(since=last_timestamp),
+                               fields=queries.CONNECTION_FIELDS + ('id',))
+    batch = log_rows[:BATCH_SIZE]
+    rows = [
+        row for row in reversed(batch)
+        if row['timestamp'] > last_timestamp or row['id'] not in seen
+    ]
+    skipped = 0
+    if len(batch) == BATCH_SIZE:
+        # Курсор (since) включает записи с временем курсора, уже увиденные - в seen
+        skipped = max(log_rows.count() - len(rows) - len(seen), 0)
+    if rows:
+        newest = rows[-1]['timestamp']
+        if newest > last_timestamp:
+            last_timestamp, seen = newest, set()
+        seen |= {row['id'] for row in rows if row['timestamp'] == last_timestamp}
+    return rows, skipped, last_timestamp, seen
+
+
+def _start_cursor():
+    """Курсор на самой новой записи: лента покажет только то, что появится дальше"""
+    newest = queries.recent_connections(1)
+    if not newest:
+        return 0.0, set()
+    _, _, last_timestamp, seen = _poll(newest[0]['timestamp'], set())
+    return last_timestamp, seen
+
+
+def _broadcast(events):
+    """Рассылает события подписчикам; в буфер для новых подписчиков попадают только записи"""
+    with _lock:
+        _recent.extend(event for event in events if 'skipped' not in event)
+        subscribers = list(_subscribers)
+    for subscription in subscribers:
+        for event in events:
+            subscription.push(event)
+
+
+def _run(since):
+    global _thread
+    # Первый подписчик продолжает с записи, которой заканчивается его страница
+    cursor = (since, set()) if since else None
+    try:
+        while True:
+            with _lock:
+                if not _subscribers:
+                    _thread = None
+                    return
+            try:
+                if cursor is None:
+                    cursor = _start_cursor()
+                else:
+                    rows, skipped, *cursor = _poll(*cursor)
+                    if rows:
+                        names = hostnames.lookup_many(row['client_address'] for row in rows)
+                        events = [_event(row, names) for row in rows]
+                        if skipped:
+                            events.insert(0, skipped_event(skipped, rows[0]['timestamp']))
+                        _broadcast(events)
+            except Exception as e:
+                print(f"Error reading live connections: {e}")
+            time.sleep(POLL_INTERVAL)
+    finally:
+        connections.close_all()
+
+
+def subscribe(since=0):
+    """Новая подписка (в цикле событий asyncio); сразу получает сохранённые события новее since"""
+    global _thread
+    subscription = Subscription(since)
+    with _lock:
+        _subscribers.add(subscription)
+        backlog = list(_recent)
+        if _thread is None:
+            _thread = threading.Thread(target=_run, args=(since,), name='live-connections', daemon=True)
+            _thread.start()
+    for event in backlog:
+        subscription._offer(event)
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        _subscribers.discard(subscription)
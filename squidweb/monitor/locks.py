@@ -0,0 +1,48 @@
+"""Распределённые блокировки через общий кэш (Redis) для задач Celery и представлений.
+
+Захват - cache.add (в Redis это атомарный SET NX с временем жизни), поэтому блокировку
+видят все процессы и воркеры. Время жизни снимает блокировку, если владелец упал.
+Снимает блокировку только владелец - по случайному токену.
+"""
+import uuid
+from contextlib import contextmanager
+from django.core.cache import cache
+
+KEY_PREFIX = 'lock:'
+
+
+def acquire(name, timeout):
+    """Токен владельца или None, если блокировка занята"""
+    token = uuid.uuid4().hex
+    if cache.add(KEY_PREFIX + name, token, timeout):
+        return token
+    return None
+
+
+def release(name, token):
+    # Блокировка могла истечь и достаться другому процессу - его не трогаем
+    if cache.get(KEY_PREFIX + name) == token:
+        cache.delete(KEY_PREFIX + name)
+
+
+def extend(name, token, timeout):
+    """Продлевает блокировку владельца на timeout; истёкшую захватывает снова, если её никто не занял.
+
+    False - блокировкой уже владеет другой процесс.
+    """
+    key = KEY_PREFIX + name
+    owner = cache.get(key)
+    if owner is None:
+        return cache.add(key, token, timeout)
+    return owner == token and cache.touch(key, timeout)
+
+
+@contextmanager
+def hold(name, timeout):
+    """with hold(name, timeout) as acquired: ... - без ожидания, acquired=False если занято"""
+    token = acquire(name, timeout)
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            release(name, token)
@@ -0,0 +1,158 @@
+"""Файлы лога: чтение строк, поиск ротированных копий, потоковая распаковка и кэш
+результатов разбора.
+
+logrotate оставляет рядом с access.log файлы access.log.1, access.log.2.gz,
+access.log-20240101.bz2 и т.п. Они больше не меняются, поэтому каждый из них
+достаточно разобрать один раз: LogColumns сохраняются в .npz, ключ - (путь,
+размер, mtime). Изменился файл - изменился ключ, и он будет разобран заново.
+"""
+import bz2
+import glob
+import gzip
+import hashlib
+import os
+from django.conf import settings
+from .columnar import LogColumns
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Меняется вместе с правилами разбора (например, выделения домена), чтобы старый кэш не использовался
+PARSE_VERSION = 3
+
+
+def open_log(path):
+    """Открывает файл лога на чтение в бинарном режиме, распаковывая его на лету"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f'Для чтения {path} нужен пакет zstandard')
+        return zstandard.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_lines(path, offset=0, end=None, partial=False, chunk_size=1024 * 1024):
+    """Выдаёт (строка, offset после неё) начиная с offset и до end, читая файл блоками.
+
+    Последняя строка без перевода строки выдаётся только с partial=True: загрузка
+    по контрольной точке её пропускает (squid ещё пишет её), а разовое чтение файла
+    целиком - нет. end должен стоять на границе строк (см. parallel.split_ranges).
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        remaining = None if end is None else end - offset
+        tail = b''
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+            for line in lines:
+                offset += len(line) + 1
+                yield line, offset
+        if partial and tail:
+            yield tail, offset + len(tail)
+
+
+def rotated_files(log_path):
+    """Ротированные копии log_path в той же директории, от старых к новым (по mtime).
+
+    Подходят имена вида access.log.N, access.log.N.gz, access.log-YYYYMMDD.bz2;
+    файлы .zst пропускаются, если пакет zstandard не установлен.
+    """
+    files = []
+    for path in glob.glob(glob.escape(log_path) + '[.-]*'):
+        if path.endswith('.zst') and zstandard is None:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if os.path.isfile(path):
+            files.append((st.st_mtime, path))
+    return [path for _, path in sorted(files)]
+
+
+def find_rotated(log_path, inode):
+    """Ротированная копия log_path (access.log.1, access.log-20240101 ...) с данным inode или None"""
+    for path in rotated_files(log_path):
+        try:
+            if os.stat(path).st_ino == inode:
+                return path
+        except OSError:
+            continue
+    return None
+
+
+def line_hash(path, offset, max_length=64 * 1024):
+    """sha1 строки, которая заканчивается перед offset (offset - позиция после '\\n').
+
+    Для offset 0 - пустая строка; None, если файл короче offset или перед offset
+    нет перевода строки (файл перезаписан).
+    """
+    if offset <= 0:
+        return ''
+    start = max(offset - max_length, 0)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(offset - start)
+    if len(data) < offset - start or not data.endswith(b'\n'):
+        return None
+    return hashlib.sha1(data[:-1].rsplit(b'\n', 1)[-1]).hexdigest()
+
+
+def artifact_path(cache_dir, path, st):
+    """Файл кэша для разобранного лога с ключом (путь, размер, mtime, правила разбора)"""
+    folding = getattr(settings, 'SQUID_DOMAIN_FOLDING', False)
+    key = f'{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}:{PARSE_VERSION}:{folding}'
+    key = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(cache_dir, f'{key}.npz')
+
+
+def load_columns(path, parse, cache_dir=None):
+    """LogColumns файла из кэша или результат parse(path), который затем кэшируется"""
+    if not cache_dir:
+        return parse(path)
+
+    artifact = artifact_path(cache_dir, path, os.stat(path))
+    if os.path.exists(artifact):
+        try:
+            return LogColumns.load(artifact)
+        except Exception as e:
+            print(f"Error loading parse cache {artifact}: {e}")
+
+    columns = parse(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        columns.save(artifact)
+    except OSError as e:
+        print(f"Error saving parse cache {artifact}: {e}")
+    return columns
+
+
+def cleanup_artifacts(cache_dir, paths):
+    """Удаляет из кэша результаты для файлов, которых больше нет или которые изменились"""
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+
+    keep = set()
+    for path in paths:
+        try:
+            keep.add(artifact_path(cache_dir, path, os.stat(path)))
+        except OSError:
+            continue
+
+    removed = 0
+    for artifact in glob.glob(os.path.join(cache_dir, '*.npz')):
+        if artifact not in keep:
+            os.remove(artifact)
+            removed += 1
+    return removed
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from monitor.utils import SquidLogReader
+from monitor.timeutils import to_datetime
+import os
+import random
+import tempfile
+import time
+
+class Command(BaseCommand):
+    help = 'Замер скорости разбора строк лога: регулярное выражение против быстрого split-парсера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=10_000_000,
+                            help='Количество строк синтетического лога (по умолчанию 10 млн)')
+        parser.add_argument('--log', help='Использовать существующий файл лога вместо синтетического')
+
+    def _generate_log(self, path, lines):
+        """Создаёт синтетический access.log в нативном формате squid"""
+        methods = ['GET', 'GET', 'GET', 'POST', 'CONNECT']
+        domains = [f'host{i}.example{i % 50}.com' for i in range(2000)]
+        start = time.time() - 30 * 86400
+        step = 30 * 86400 / max(lines, 1)
+
+        with open(path, 'w') as f:
+            for i in range(lines):
+                method = random.choice(methods)
+                domain = random.choice(domains)
+                url = f'{domain}:443' if method == 'CONNECT' else f'http://{domain}/path/{i % 1000}'
+                f.write(
+                    f'{start + i * step:.3f} {random.randint(1, 5000)} '
+                    f'192.168.101.{random.randint(1, 254)} TCP_MISS/200 {random.randint(100, 500000)} '
+                    f'{method} {url} - HIER_DIRECT/10.0.0.{random.randint(1, 254)} text/html\n'
+                )
+
+    def _measure(self, path, parse):
+        """Возвращает (количество разобранных строк, строк в секунду)"""
+        parsed = 0
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            for line in f:
+                if parse(line):
+                    parsed += 1
+        elapsed = time.perf_counter() - started
+        return parsed, parsed / elapsed if elapsed else 0
+
+    def handle(self, *args, **options):
+        reader = SquidLogReader()
+        path = options['log']
+        generated = False
+
+        if not path:
+            fd, path = tempfile.mkstemp(suffix='.log')
+            os.close(fd)
+            generated = True
+            self.stdout.write(f'Генерация синтетического лога на {options["lines"]} строк: {path}')
+            self._generate_log(path, options['lines'])
+
+        try:
+            def legacy_parse(line):
+                # Прежний путь: регулярное выражение и datetime по Москве для каждой строки
+                entry = reader._parse_line_regex(line.decode('utf-8', errors='ignore'))
+                if entry:
+                    entry['timestamp'] = to_datetime(entry['timestamp'])
+                return entry
+
+            self.stdout.write('Регулярное выражение + datetime (прежний парсер)...')
+            regex_count, regex_rate = self._measure(path, legacy_parse)
+            self.stdout.write(f'  {regex_count} строк, {regex_rate:,.0f} строк/сек')
+
+            self.stdout.write('Split-парсер (быстрый путь)...')
+            fast_count, fast_rate = self._measure(path, reader._parse_line)
+            self.stdout.write(f'  {fast_count} строк, {fast_rate:,.0f} строк/сек')
+
+            if regex_rate:
+                self.stdout.write(self.style.SUCCESS(f'Ускорение: {fast_rate / regex_rate:.2f}x'))
+        finally:
+            if generated:
+                os.remove(path)
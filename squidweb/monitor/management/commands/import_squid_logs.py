@@ -1,15 +1,234 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from monitor.models import SquidLog
-from datetime import datetime
-import re
+from monitor.models import SquidLog, TrafficRollup, ImportCheckpoint
+from monitor.rollups import RollupAccumulator
+from monitor.parallel import split_ranges, map_ordered, parse_import_line, parse_import_range
+from monitor.utils import SquidLogReader
+from monitor import logfiles
+from monitor.logfiles import line_hash
+from monitor.bulkload import BulkLoader
+from monitor import locks, partitions
+from monitor.partitions import PartitionWriter
+from datetime import datetime, timedelta
+from django.db.models import Min
 from django.db import transaction
 from django.utils import timezone
 import os
+import time
+
+# Блокировка контрольной точки продлевается с каждой пачкой и в цикле слежения,
+# а после падения процесса истекает сама
+LOCK_TIMEOUT = 600
 
 class Command(BaseCommand):
     help = 'Импорт логов из Squid access.log'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Количество процессов для разбора лога (0 - по числу ядер, по умолчанию 1)')
+        parser.add_argument('--rotated', action='store_true',
+                            help='Дополнить агрегаты трафика данными из ротированных логов (.1, .gz, .bz2, .zst)')
+        parser.add_argument('--bulk', action='store_true',
+                            help='Быстрая загрузка в обход ORM (executemany/COPY); в пустую таблицу - '
+                                 'с перестроением индексов в конце')
+        parser.add_argument('--batch-size', type=int,
+                            help='Записей в одной транзакции (по умолчанию 1000, с --bulk - 50000)')
+
+    def _backfill_rotated(self, workers):
+        """Заполняет TrafficRollup из ротированных копий лога.
+
+        Берутся только записи старше самых ранних уже сохранённых агрегатов, поэтому
+        повторный запуск и данные, импортированные из текущего файла, не задваиваются.
+        Сами записи в SquidLog не попадают - там хранятся только последние 2 дня.
+        """
+        earliest = TrafficRollup.objects.aggregate(earliest=Min('bucket_start'))['earliest']
+        until = earliest.timestamp() if earliest else None
+        since = (timezone.now() - timedelta(days=366)).timestamp()
+        reader = SquidLogReader(settings.SQUID_LOG_PATH)
+
+        for path, columns in reader.iter_rotated_columns(since, settings.SQUID_PARSE_CACHE_DIR, workers):
+            if until is not None:
+                columns = columns.filter(columns.timestamp < until)
+            rollups = RollupAccumulator()
+            rollups.add_columns(columns)
+            with transaction.atomic():
+                rollups.flush()
+            self.stdout.write(f'Агрегаты из {path}: {len(columns)} записей')
+
+    def _read_sequential(self, path, start, last_epoch):
+        """Разбирает файл с позиции start в текущем процессе, выдавая результаты
+        пачками в том же виде, что и parse_import_range"""
+        rows = []
+        processed = 0
+        skipped = 0
+        offset = start
+        for line, offset in logfiles.iter_lines(path, start):
+            processed += 1
+            line = line.decode('utf-8', errors='ignore')
+            try:
+                row = parse_import_line(line)
+            except Exception as e:
+                if processed <= 5:
+                    self.stdout.write(self.style.WARNING(f'Ошибка при обработке строки: {line.strip()}\nОшибка: {str(e)}'))
+                continue
+            if row is None:
+                continue
+            # Пропускаем старые записи
+            if last_epoch is not None and row[0] <= last_epoch:
+                skipped += 1
+                continue
+            rows.append(row + (offset,))
+            if len(rows) >= 1000:
+                yield rows, processed, skipped, offset
+                rows, processed, skipped = [], 0, 0
+        yield rows, processed, skipped, offset
+
+    def _save_batch(self, new_logs, rollups, checkpoint, path, inode, offset):
+        """Сохраняет пачку записей, агрегаты и контрольную точку в одной транзакции.
+
+        После сбоя посреди пачки не сохраняется ничего из неё, и следующий запуск
+        продолжит ровно с конца предыдущей пачки.
+        """
+        self._keep_lock()
+        # Таблицы суточных разделов создаются до транзакции
+        groups = self.writer.split(new_logs)
+        with transaction.atomic():
+            self.writer.write(groups)
+            rollups.flush()
+            checkpoint.inode = inode
+            checkpoint.offset = offset
+            checkpoint.line_hash = line_hash(path, offset)
+            checkpoint.save()
+
+    def _find_start(self, path, checkpoint):
+        """Список (файл, inode, начальный offset), которые нужно дочитать по контрольной точке"""
+        st = os.stat(path)
+
+        if checkpoint.inode != st.st_ino:
+            # logrotate переименовал файл: дочитываем хвост прежнего, новый - с начала
+            sources = []
+            rotated_path = logfiles.find_rotated(path, checkpoint.inode)
+            if rotated_path and line_hash(rotated_path, checkpoint.offset) == checkpoint.line_hash:
+                self.stdout.write(f'Лог ротирован, дочитываем {rotated_path} с позиции {checkpoint.offset}')
+                sources.append((rotated_path, checkpoint.inode, checkpoint.offset))
+            else:
+                self.stdout.write(self.style.WARNING('Лог ротирован, прежний файл не найден - его хвост пропущен'))
+            sources.append((path, st.st_ino, 0))
+            return sources
+
+        if line_hash(path, checkpoint.offset) != checkpoint.line_hash:
+            # Файл обрезан (copytruncate) или перезаписан
+            self.stdout.write(self.style.WARNING('Файл лога перезаписан, читаем с начала'))
+            return [(path, st.st_ino, 0)]
+
+        return [(path, st.st_ino, checkpoint.offset)]
+
+    def _keep_lock(self):
+        """Продлевает блокировку контрольной точки; если её перехватил другой процесс - останавливается"""
+        if not locks.extend(self.lock_name, self.lock_token, LOCK_TIMEOUT):
+            raise CommandError('Блокировка контрольной точки потеряна: журнал загружает другой процесс')
+
+    def _release_lock(self):
+        if getattr(self, 'lock_token', None) is not None:
+            locks.release(self.lock_name, self.lock_token)
+            self.lock_token = None
+
+    def _plan(self, path):
+        """Контрольная точка и список (файл, inode, offset), которые нужно дочитать.
+
+        Возвращает (checkpoint, sources, last_epoch); last_epoch задан только при первом
+        запуске без контрольной точки - уже импортированное ранее отсекается по времени.
+        Контрольную точку path одновременно ведёт только один процесс (import_squid_logs
+        или ingest_squid_logs): блокировка держится до _release_lock(), иначе оба вставили
+        бы одни и те же строки.
+        """
+        self.lock_name = 'import:' + path
+        self.lock_token = locks.acquire(self.lock_name, LOCK_TIMEOUT)
+        if self.lock_token is None:
+            raise CommandError(f'Лог {path} уже загружает другой процесс (ingest_squid_logs или import_squid_logs)')
+
+        checkpoint = ImportCheckpoint.objects.filter(path=path).first()
+        if checkpoint is None:
+            last_timestamp = partitions.latest_timestamp()
+            self.stdout.write(f'Последняя запись в базе: {last_timestamp}')
+            last_epoch = last_timestamp.timestamp() if last_timestamp else None
+            return ImportCheckpoint(path=path), [(path, os.stat(path).st_ino, 0)], last_epoch
+
+        self.stdout.write(f'Контрольная точка: inode {checkpoint.inode}, позиция {checkpoint.offset}')
+        return checkpoint, self._find_start(path, checkpoint), None
+
+    def _setup_loader(self, options, default_batch_size=1000):
+        """Выбирает способ вставки в суточные разделы и размер пачки"""
+        self.batch_size = options['batch_size'] or (50000 if options['bulk'] else default_batch_size)
+        changes = partitions.upgrade()
+        if changes:
+            self.stdout.write(f'Схема суточных разделов обновлена: {changes} изменений')
+        if not options['bulk']:
+            self.writer = PartitionWriter()
+            return
+
+        BulkLoader().prepare()
+        # Первичная загрузка: индексы новых таблиц дешевле построить один раз в конце
+        defer_indexes = not partitions.has_rows()
+        if defer_indexes:
+            self.stdout.write('База пуста: индексы будут построены после загрузки')
+        self.writer = PartitionWriter(bulk=True, defer_indexes=defer_indexes)
+
+    def _import_file(self, path, inode, start, last_epoch, workers, checkpoint, stats):
+        """Импортирует строки файла начиная с start, продвигая контрольную точку"""
+        if workers > 1:
+            # Файл делится на диапазоны по строкам, разбор идёт в пуле процессов,
+            # а результаты вставляются в БД в порядке диапазонов
+            self.stdout.write(f'Параллельный разбор {path}: {workers} процессов')
+            ranges, _ = split_ranges(path, workers, start=start)
+            tasks = [(path, range_start, range_end, last_epoch) for range_start, range_end in ranges]
+            chunks = map_ordered(parse_import_range, tasks, workers)
+        else:
+            chunks = self._read_sequential(path, start, last_epoch)
+
+        # Сырые записи хранятся только последние 2 дня, более старые
+        # попадают лишь в агрегаты
+        retention_limit = (timezone.now() - timedelta(days=2)).timestamp()
+        new_logs = []
+        rollups = RollupAccumulator()
+        pending = 0
+        offset = start
+
+        for rows, processed, skipped, end in chunks:
+            stats['processed'] += processed
+            # Распознаны и новые строки, и пропущенные старые
+            stats['matched'] += len(rows) + skipped
+            stats['skipped'] += skipped
+            stats['added'] += len(rows)
+
+            for (timestamp, client_address, result_code, bytes_sent, request_method, url,
+                 user_ident, hierarchy_code, content_type, domain, offset) in rows:
+                pending += 1
+
+                # Агрегаты по часам и суткам для длинных периодов
+                rollups.add(timestamp, client_address, domain, bytes_sent)
+
+                if timestamp >= retention_limit:
+                    # Поля в порядке модели SquidLog (см. BulkLoader)
+                    new_logs.append((
+                        timezone.make_aware(datetime.fromtimestamp(timestamp)), client_address, result_code,
+                        bytes_sent, request_method, url, user_ident, hierarchy_code, content_type, domain[:255]
+                    ))
+                
+                # Пакетная вставка каждые batch_size записей
+                if pending >= self.batch_size:
+                    self._save_batch(new_logs, rollups, checkpoint, path, inode, offset)
+                    self.stdout.write(f'Импортировано {pending} записей (всего обработано: {stats["processed"]})')
+                    new_logs = []
+                    pending = 0
+
+            offset = end
+
+        # Оставшиеся записи; контрольная точка сдвигается до конца последней целой строки
+        self._save_batch(new_logs, rollups, checkpoint, path, inode, offset)
+        if pending:
+            self.stdout.write(f'Импортировано последние {pending} записей')
+
     def handle(self, *args, **options):
         self.stdout.write(f'Начинаем импорт логов из {settings.SQUID_LOG_PATH}')
         
@@ -27,88 +246,39 @@ class Command(BaseCommand):
         file_size = os.path.getsize(settings.SQUID_LOG_PATH)
         self.stdout.write(f'Размер файла лога: {file_size} байт')
         
-        # Паттерн для формата лога Squid
-        log_pattern = re.compile(
-            r'(\d+\.\d+)\s+(\d+)\s+(\S+)\s+(\S+)\/(\d+)\s+(\d+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)'
-        )
-        
-        # Читаем последнюю запись из базы
-        last_log = SquidLog.objects.order_by('-timestamp').first()
-        last_timestamp = last_log.timestamp if last_log else None
-        self.stdout.write(f'Последняя запись в базе: {last_timestamp}')
+        workers = options['workers'] or os.cpu_count() or 1
+        if options['rotated']:
+            self._backfill_rotated(workers)
 
-        new_logs = []
-        processed_lines = 0
-        matched_lines = 0
-        skipped_lines = 0
-        
-        with open(settings.SQUID_LOG_PATH, 'r') as file:
-            for line in file:
-                processed_lines += 1
-                try:
-                    # Пропускаем пустые строки
-                    if not line.strip():
-                        continue
-                        
-                    parts = line.strip().split()
-                    if len(parts) < 10:
-                        continue
-                        
-                    timestamp = float(parts[0])
-                    log_time = timezone.make_aware(datetime.fromtimestamp(timestamp))
-                    
-                    # Пропускаем старые записи
-                    if last_timestamp and log_time <= last_timestamp:
-                        skipped_lines += 1
-                        continue
-                        
-                    matched_lines += 1
-                    
-                    # Разбираем строку лога
-                    result_code_parts = parts[3].split('/')
-                    result_code = parts[3]  # Оставляем как есть, если не удастся разделить
-                    if len(result_code_parts) == 2:
-                        result_code = f"{result_code_parts[0]}/{result_code_parts[1]}"
-                    
-                    new_logs.append(SquidLog(
-                        timestamp=log_time,
-                        client_address=parts[2],
-                        result_code=result_code,
-                        bytes=int(parts[4]),
-                        request_method=parts[5],
-                        url=parts[6],
-                        user_ident=parts[7],
-                        hierarchy_code=parts[8],
-                        content_type=parts[9]
-                    ))
-                    
-                    # Пакетная вставка каждые 1000 записей
-                    if len(new_logs) >= 1000:
-                        with transaction.atomic():
-                            SquidLog.objects.bulk_create(new_logs)
-                        self.stdout.write(f'Импортировано 1000 записей (всего обработано: {processed_lines})')
-                        new_logs = []
-                except Exception as e:
-                    if processed_lines <= 5:
-                        self.stdout.write(self.style.WARNING(f'Ошибка при обработке строки: {line.strip()}\nОшибка: {str(e)}'))
-                    continue
-
-        # Вставляем оставшиеся записи
-        if new_logs:
-            with transaction.atomic():
-                SquidLog.objects.bulk_create(new_logs)
-            self.stdout.write(f'Импортировано последние {len(new_logs)} записей')
+        checkpoint, sources, last_epoch = self._plan(settings.SQUID_LOG_PATH)
+        try:
+            self._setup_loader(options)
+
+            stats = {'processed': 0, 'matched': 0, 'skipped': 0, 'added': 0}
+            started = time.perf_counter()
+            try:
+                for path, inode, start in sources:
+                    self._import_file(path, inode, start, last_epoch, workers, checkpoint, stats)
+            finally:
+                rebuilt = self.writer.finish()
+                if rebuilt:
+                    self.stdout.write(f'Построено индексов: {rebuilt}')
+        finally:
+            self._release_lock()
+        elapsed = time.perf_counter() - started
 
         # Выводим статистику
         self.stdout.write(f'''
 Статистика импорта:
-- Всего обработано строк: {processed_lines}
-- Успешно распознано: {matched_lines}
-- Пропущено старых записей: {skipped_lines}
-- Добавлено новых записей: {matched_lines - skipped_lines}
+- Всего обработано строк: {stats['processed']}
+- Успешно распознано: {stats['matched']}
+- Пропущено старых записей: {stats['skipped']}
+- Добавлено новых записей: {stats['added']}
+- Время загрузки: {elapsed:.1f} сек ({stats['processed'] / elapsed if elapsed else 0:,.0f} строк/сек)
 ''')
 
-        # Очищаем старые логи
+        # Очищаем старые логи и агрегаты
         SquidLog.cleanup_old_logs()
+        TrafficRollup.cleanup_old_rollups()
 
         self.stdout.write(self.style.SUCCESS('Импорт логов успешно завершен'))
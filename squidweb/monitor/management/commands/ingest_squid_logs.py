@@ -0,0 +1,206 @@
+from django.conf import settings
+from django.core.cache import cache
+from monitor.models import SquidLog, TrafficRollup
+from monitor.rollups import RollupAccumulator
+from monitor.parallel import parse_import_line
+from monitor.utils import SquidLogReader
+from monitor.management.commands.import_squid_logs import Command as ImportCommand
+from datetime import datetime, timedelta
+from django.utils import timezone
+import os
+import signal
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+CLEANUP_INTERVAL = 3600  # Раз в час удаляем записи старше срока хранения
+
+class Command(ImportCommand):
+    help = 'Непрерывная загрузка access.log в базу: дочитывает лог и следит за новыми строками'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--follow', action='store_true',
+                            help='Не завершаться, а следить за логом и загружать новые строки')
+        parser.add_argument('--flush-interval', type=float, default=2.0,
+                            help='Максимальное время (сек) между записью пачки в базу (по умолчанию 2)')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Интервал проверки лога без inotify (сек, по умолчанию 1)')
+
+    def _wait(self, inotify, timeout):
+        """Ждёт изменений в директории лога (inotify) или просто timeout секунд"""
+        if inotify is not None:
+            inotify.read(timeout=int(timeout * 1000))
+        else:
+            time.sleep(timeout)
+
+    def _read_lines(self, reader, inode, offset, limit):
+        """До limit разобранных строк после offset: [(row или None, offset после строки)].
+
+        None вместо списка - по пути лога уже другой файл (ротация) или файл обрезан.
+        """
+        lines = reader.read_new_lines(inode, offset, limit)
+        if lines is None:
+            return None
+        rows = []
+        for line, offset in lines:
+            try:
+                row = parse_import_line(line.decode('utf-8', errors='ignore'))
+            except ValueError:
+                row = None
+            rows.append((row, offset))
+        return rows
+
+    def _publish_metrics(self, path, checkpoint, buffered, last_entry, rate=None):
+        """Сохраняет метрики отставания загрузки в кэш (ключ 'ingest_metrics').
+
+        rate - скорость записи последней пачки (строк/сек), None - оставить прежнюю.
+        """
+        try:
+            backlog = max(os.path.getsize(path) - checkpoint.offset, 0)
+        except OSError:
+            backlog = 0
+        now = time.time()
+        self.metrics.update({
+            'updated_at': now,
+            'last_entry_time': last_entry,
+            # Отставание есть, только пока в логе или в буфере остаются незаписанные строки
+            'lag_seconds': now - last_entry if last_entry and (backlog or buffered) else 0,
+            'backlog_bytes': backlog,
+            'buffered_rows': buffered,
+        })
+        if rate is not None:
+            self.metrics['rows_per_sec'] = rate
+        cache.set('ingest_metrics', self.metrics, None)
+
+    def _follow(self, path, checkpoint, options):
+        """Основной цикл: микро-пачки по размеру (--batch-size) и времени (--flush-interval).
+
+        За раз читается не больше строк, чем осталось до полной пачки, а следующее
+        чтение начинается только после записи пачки - при медленной базе данные
+        копятся в самом файле лога, а не в памяти; их объём виден в backlog_bytes.
+        """
+        inotify = None
+        if INotify is not None:
+            inotify = INotify()
+            inotify.add_watch(os.path.dirname(path) or '.',
+                              flags.MODIFY | flags.CREATE | flags.MOVED_TO | flags.MOVED_FROM)
+            self.stdout.write('Слежение за логом через inotify')
+        else:
+            self.stdout.write(f'Опрос лога каждые {options["poll_interval"]} сек')
+
+        reader = SquidLogReader(path)
+        inode, offset = checkpoint.inode, checkpoint.offset
+        new_logs = []
+        rollups = RollupAccumulator()
+        pending = 0
+        batch_started = None
+        last_entry = None
+        last_cleanup = time.monotonic()
+
+        def flush():
+            nonlocal new_logs, pending, batch_started
+            started = time.perf_counter()
+            self._save_batch(new_logs, rollups, checkpoint, path, inode, offset)
+            elapsed = time.perf_counter() - started
+            self.metrics['total_rows'] += pending
+            self.metrics['batches'] += 1
+            self._publish_metrics(path, checkpoint, 0, last_entry, pending / elapsed if elapsed else 0)
+            new_logs, pending, batch_started = [], 0, None
+
+        while not self.stopping:
+            rows = self._read_lines(reader, inode, offset, self.batch_size - pending)
+
+            if rows is None:
+                # Ротация или обрезка: записываем буфер и дочитываем по контрольной точке
+                if pending:
+                    flush()
+                self.stdout.write('Файл лога сменился, дочитываем по контрольной точке')
+                stats = {'processed': 0, 'matched': 0, 'skipped': 0, 'added': 0}
+                for source_path, source_inode, start in self._find_start(path, checkpoint):
+                    self._import_file(source_path, source_inode, start, None, 1, checkpoint, stats)
+                self.metrics['total_rows'] += stats['added']
+                inode, offset = checkpoint.inode, checkpoint.offset
+                continue
+
+            retention_limit = (timezone.now() - timedelta(days=2)).timestamp()
+            for row, offset in rows:
+                if row is None:
+                    continue
+                (timestamp, client_address, result_code, bytes_sent, request_method, url,
+                 user_ident, hierarchy_code, content_type, domain) = row
+                rollups.add(timestamp, client_address, domain, bytes_sent)
+                if timestamp >= retention_limit:
+                    new_logs.append((
+                        timezone.make_aware(datetime.fromtimestamp(timestamp)), client_address, result_code,
+                        bytes_sent, request_method, url, user_ident, hierarchy_code, content_type, domain[:255]
+                    ))
+                pending += 1
+                last_entry = timestamp
+                if batch_started is None:
+                    batch_started = time.monotonic()
+
+            # Пачка пишется при заполнении или по истечении flush_interval с первой строки в ней
+            if pending and (pending >= self.batch_size or
+                            time.monotonic() - batch_started >= options['flush_interval']):
+                flush()
+
+            if rows:
+                continue
+
+            if time.monotonic() - last_cleanup >= CLEANUP_INTERVAL:
+                SquidLog.cleanup_old_logs()
+                TrafficRollup.cleanup_old_rollups()
+                last_cleanup = time.monotonic()
+
+            self._keep_lock()
+            self._publish_metrics(path, checkpoint, pending, last_entry)
+            self._wait(inotify, min(options['poll_interval'], options['flush_interval']))
+
+        if pending:
+            flush()
+
+    def _stop(self, signum, frame):
+        self.stdout.write('Получен сигнал остановки, записываем последнюю пачку')
+        self.stopping = True
+
+    def handle(self, *args, **options):
+        path = settings.SQUID_LOG_PATH
+        if not os.access(path, os.R_OK):
+            self.stdout.write(self.style.ERROR(f'Нет доступа к файлу лога: {path}'))
+            return
+
+        self.stopping = False
+        self.metrics = {'started_at': time.time(), 'total_rows': 0, 'batches': 0, 'rows_per_sec': 0}
+
+        # Сначала дочитываем накопившееся с прошлого запуска так же, как import_squid_logs
+        checkpoint, sources, last_epoch = self._plan(path)
+        try:
+            self._setup_loader(options, default_batch_size=5000)
+            stats = {'processed': 0, 'matched': 0, 'skipped': 0, 'added': 0}
+            try:
+                for source_path, inode, start in sources:
+                    self._import_file(source_path, inode, start, last_epoch,
+                                      options['workers'] or os.cpu_count() or 1, checkpoint, stats)
+            finally:
+                rebuilt = self.writer.finish()
+                if rebuilt:
+                    self.stdout.write(f'Построено индексов: {rebuilt}')
+            # Разделы, созданные дальше в режиме слежения, сразу получают индексы
+            self.writer.defer_indexes = False
+            self.metrics['total_rows'] += stats['added']
+            self.stdout.write(f'Дочитано записей: {stats["added"]}')
+
+            if options['follow']:
+                # Остановка по сигналу - после записи текущей пачки
+                signal.signal(signal.SIGTERM, self._stop)
+                signal.signal(signal.SIGINT, self._stop)
+                self._follow(path, checkpoint, options)
+        finally:
+            # Блокировка контрольной точки держится всё время работы демона
+            self._release_lock()
+
+        self.stdout.write(self.style.SUCCESS('Загрузка логов остановлена'))
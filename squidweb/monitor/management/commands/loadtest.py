@@ -0,0 +1,111 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест работающего сервера: задержки и пропускная способность страниц при '
+            'одновременных запросах. --background держит параллельно медленные запросы (например, '
+            'страницу пользователя за месяц) - так видно, блокируют ли они остальные страницы '
+            '(WSGI с пулом потоков против ASGI)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='Адрес сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Страница для проверки (можно несколько раз), по умолчанию /, /users/, /connections/')
+        parser.add_argument('--concurrency', type=int, default=20, help='Одновременных запросов')
+        parser.add_argument('--requests', type=int, default=200, help='Всего запросов к проверяемым страницам')
+        parser.add_argument('--background', action='append', default=[],
+                            help='Медленная страница, которую фоновые клиенты запрашивают всё время теста')
+        parser.add_argument('--background-concurrency', type=int, default=10, help='Фоновых клиентов')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Таймаут одного запроса (секунды)')
+        parser.add_argument('--header', action='append', default=[],
+                            help='Дополнительный заголовок "Имя: значение", например Cache-Control: no-cache')
+
+    def _fetch(self, url, headers, timeout):
+        """(код ответа или текст ошибки, время в секундах)"""
+        request = urllib.request.Request(url, headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, OSError) as e:
+            status = type(e).__name__
+        return status, time.perf_counter() - start
+
+    def _percentile(self, values, fraction):
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+    def _report(self, title, results, elapsed=None):
+        latencies = sorted(latency for _, latency in results)
+        statuses = Counter(status for status, _ in results)
+        if elapsed:
+            self.stdout.write(f'{title}: {len(results)} запросов за {elapsed:.2f} с ({len(results) / elapsed:.1f} в секунду)')
+        else:
+            self.stdout.write(f'{title}: {len(results)} запросов')
+        if latencies:
+            self.stdout.write(
+                f'  задержка, мс: p50 {self._percentile(latencies, 0.5) * 1000:.0f}, '
+                f'p95 {self._percentile(latencies, 0.95) * 1000:.0f}, '
+                f'p99 {self._percentile(latencies, 0.99) * 1000:.0f}, '
+                f'max {latencies[-1] * 1000:.0f}'
+            )
+        self.stdout.write('  ответы: ' + ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items(), key=str)))
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        paths = options['paths'] or ['/', '/users/', '/connections/']
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency и --requests должны быть больше нуля')
+
+        headers = {}
+        for header in options['header']:
+            name, _, value = header.partition(':')
+            headers[name.strip()] = value.strip()
+        timeout = options['timeout']
+
+        # Фоновые клиенты крутят медленные страницы до конца основного теста
+        stop = threading.Event()
+        background_results = []
+        background_lock = threading.Lock()
+
+        def background(url):
+            while not stop.is_set():
+                result = self._fetch(url, headers, timeout)
+                with background_lock:
+                    background_results.append(result)
+
+        background_threads = []
+        for path in options['background']:
+            for _ in range(options['background_concurrency']):
+                thread = threading.Thread(target=background, args=(base_url + path,), daemon=True)
+                thread.start()
+                background_threads.append(thread)
+        if background_threads:
+            self.stdout.write(f'Фоновых клиентов: {len(background_threads)} ({", ".join(options["background"])})')
+            time.sleep(1)  # Даём фоновым запросам занять сервер
+
+        urls = [base_url + paths[i % len(paths)] for i in range(options['requests'])]
+        results = {path: [] for path in paths}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for url, result in zip(urls, executor.map(lambda url: self._fetch(url, headers, timeout), urls)):
+                results[url[len(base_url):]].append(result)
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        for thread in background_threads:
+            thread.join(timeout)
+
+        self.stdout.write(f'Одновременных запросов: {options["concurrency"]}')
+        for path, path_results in results.items():
+            self._report(path, path_results)
+        self._report('Всего', [result for path_results in results.values() for result in path_results], elapsed)
+        if background_results:
+            self._report('Фоновые запросы', background_results, elapsed)
@@ -1,24 +1,14 @@
-from django.core.management.base import BaseCommand
-from monitor.tasks import update_log_cache, generate_traffic_charts, generate_domain_charts, update_users_cache
+from django.core.management.base import BaseCommand, CommandError
+from monitor.tasks import refresh_statistics
 
 class Command(BaseCommand):
     help = 'Обновляет кэш для ускорения работы приложения'
 
     def handle(self, *args, **options):
-        self.stdout.write('Обновление кэша логов...')
-        entries_count = update_log_cache()
-        self.stdout.write(self.style.SUCCESS(f'Кэш логов обновлен, обработано {entries_count} записей'))
-        
-        self.stdout.write('Генерация графиков трафика...')
-        generate_traffic_charts()
-        self.stdout.write(self.style.SUCCESS('Графики трафика сгенерированы'))
-        
-        self.stdout.write('Генерация графиков доменов...')
-        generate_domain_charts()
-        self.stdout.write(self.style.SUCCESS('Графики доменов сгенерированы'))
-        
-        self.stdout.write('Обновление кэша пользователей...')
-        users_count = update_users_cache()
-        self.stdout.write(self.style.SUCCESS(f'Кэш пользователей обновлен, обработано {users_count} пользователей'))
-        
-        self.stdout.write(self.style.SUCCESS('Все задачи выполнены успешно'))
+        self.stdout.write('Обновление статистики и графиков...')
+        result = refresh_statistics()
+        if result is None:
+            raise CommandError('Обновление уже выполняется другим процессом')
+        self.stdout.write(self.style.SUCCESS(
+            f'Кэш обновлен: ключей {result["keys"]}, новых графиков {result["charts"]}, '
+            f'пользователей {result["users"]}'))
@@ -5,7 +5,7 @@ from django.utils import timezone
 
 class SquidLog(models.Model):
     timestamp = models.DateTimeField(db_index=True)
-    client_address = models.GenericIPAddressField(db_index=True)
+    client_address = models.GenericIPAddressField()
     result_code = models.CharField(max_length=50)
     bytes = models.IntegerField()
     request_method = models.CharField(max_length=20)
@@ -13,13 +13,15 @@ class SquidLog(models.Model):
     user_ident = models.CharField(max_length=50, blank=True)
     hierarchy_code = models.CharField(max_length=50)
     content_type = models.CharField(max_length=255, blank=True)
+    domain = models.CharField(max_length=255, blank=True)  # Домен назначения, вычисляется при импорте
 
     class Meta:
+        # Покрывающие индексы под запросы monitor.queries (проверяются тестами monitor.tests):
+        # за период - итоги, часы, домены и клиенты; по клиенту - то же для одного пользователя.
+        # Одиночный индекс timestamp - для ленты последних подключений.
         indexes = [
-            models.Index(fields=['timestamp', 'client_address']),
-            models.Index(fields=['client_address', 'timestamp']),
-            models.Index(fields=['timestamp', 'bytes']),
-            models.Index(fields=['client_address', 'bytes']),
+            models.Index(fields=['timestamp', 'client_address', 'bytes', 'domain'], name='squidlog_time_idx'),
+            models.Index(fields=['client_address', 'timestamp', 'bytes', 'domain'], name='squidlog_client_idx'),
         ]
         ordering = ['-timestamp']
         
@@ -36,6 +38,65 @@ class SquidLog(models.Model):
 
     @classmethod
     def cleanup_old_logs(cls):
-        """Удаляет логи старше 2 дней"""
+        """Удаляет логи старше 2 дней: суточные разделы целиком и старые записи в самой таблице"""
+        from .partitions import cleanup
+
         two_days_ago = timezone.now() - timedelta(days=2)
         cls.objects.filter(timestamp__lt=two_days_ago).delete()
+        cleanup(days=2)
+
+
+class TrafficRollup(models.Model):
+    """Предагрегированный трафик: запросы и байты за час или сутки по клиенту и домену"""
+    GRANULARITY_CHOICES = [
+        ('hour', 'Час'),
+        ('day', 'Сутки'),
+    ]
+
+    bucket_start = models.DateTimeField()
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    client_address = models.GenericIPAddressField()
+    domain = models.CharField(max_length=255)
+    requests = models.BigIntegerField(default=0)
+    bytes = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket_start', 'client_address', 'domain'],
+                name='traffic_rollup_bucket_unique'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'client_address', 'bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start} - {self.client_address} - {self.domain}"
+
+    @classmethod
+    def expired(cls):
+        """QuerySet'ы агрегатов с истёкшим сроком: почасовые старше 30 дней, суточные старше года"""
+        now = timezone.now()
+        return [
+            cls.objects.filter(granularity='hour', bucket_start__lt=now - timedelta(days=30)),
+            cls.objects.filter(granularity='day', bucket_start__lt=now - timedelta(days=366)),
+        ]
+
+    @classmethod
+    def cleanup_old_rollups(cls):
+        """Удаляет агрегаты с истёкшим сроком хранения"""
+        for queryset in cls.expired():
+            queryset.delete()
+
+
+class ImportCheckpoint(models.Model):
+    """Позиция в файле лога, до которой import_squid_logs уже импортировал записи"""
+    path = models.CharField(max_length=500, unique=True)
+    inode = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    line_hash = models.CharField(max_length=40, blank=True)  # sha1 последней импортированной строки
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} - inode {self.inode}, offset {self.offset}"
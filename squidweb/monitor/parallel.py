@@ -0,0 +1,121 @@
+"""Разбор большого лога в пуле процессов.
+
+Файл делится на диапазоны байт, выровненные по началу строк. Каждый процесс
+разбирает свой диапазон и возвращает компактный результат (LogColumns или
+кортежи для импорта), а результаты выдаются строго в порядке диапазонов -
+итог не зависит от того, какой процесс закончил первым.
+"""
+import math
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .domains import url_domain
+from . import logfiles
+from .utils import SquidLogReader
+
+# Размер диапазона: достаточно крупный, чтобы накладные расходы на процесс
+# были незаметны, и достаточно мелкий, чтобы результаты не раздували память
+RANGE_SIZE = 64 * 1024 * 1024
+
+
+def split_ranges(path, parts, range_size=RANGE_SIZE, start=0):
+    """Делит файл с позиции start на диапазоны [start, end) из целых строк.
+
+    Диапазонов не меньше parts и не больше, чем нужно для range_size байт на
+    диапазон. Неполная последняя строка (squid ещё пишет её) в диапазоны не входит.
+    Возвращает (диапазоны, end последнего диапазона).
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= start:
+            return [], start
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = mm.rfind(b'\n', start) + 1
+            if size == 0:
+                return [], start
+            count = max(parts, math.ceil((size - start) / range_size), 1)
+            bounds = [start]
+            for i in range(1, count):
+                position = mm.find(b'\n', start + (size - start) * i // count) + 1
+                if bounds[-1] < position < size:
+                    bounds.append(position)
+            bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:])), size
+
+
+def map_ordered(func, tasks, workers):
+    """Выполняет func(*args) для каждого args из tasks и выдаёт результаты по порядку.
+
+    В пуле одновременно не больше 2 * workers задач, поэтому медленный потребитель
+    (например, вставка в БД) не даёт результатам копиться в памяти. При workers <= 1
+    и внутри демонического процесса (воркер Celery prefork не может порождать
+    дочерние процессы) задачи выполняются по очереди в текущем процессе.
+    """
+    if workers <= 1 or multiprocessing.current_process().daemon:
+        for args in tasks:
+            yield func(*args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for args in tasks:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def parse_rotated(log_path, path, cache_dir=None, since=None):
+    """LogColumns ротированного файла (через кэш разбора), записи не старше since"""
+    reader = SquidLogReader(log_path)
+    columns = logfiles.load_columns(path, reader._parse_file, cache_dir)
+    return columns.slice_time(since=since)
+
+
+def parse_import_line(line):
+    """Разбирает строку лога (str) для import_squid_logs.
+
+    Возвращает кортеж (timestamp, client_address, result_code, bytes, request_method,
+    url, user_ident, hierarchy_code, content_type, domain) или None для строк
+    с числом полей меньше 10. Некорректные числа приводят к ValueError.
+    """
+    parts = line.split()
+    if len(parts) < 10:
+        return None
+
+    timestamp = float(parts[0])
+
+    result_code_parts = parts[3].split('/')
+    result_code = parts[3]  # Оставляем как есть, если не удастся разделить
+    if len(result_code_parts) == 2:
+        result_code = f"{result_code_parts[0]}/{result_code_parts[1]}"
+
+    return (timestamp, parts[2], result_code, int(parts[4]), parts[5], parts[6],
+            parts[7], parts[8], parts[9], url_domain(parts[6]))
+
+
+def parse_import_range(path, start, end, last_timestamp=None):
+    """Разбирает диапазон файла для импорта.
+
+    Возвращает (строки новее last_timestamp, обработано строк, пропущено старых, end);
+    к каждой строке добавлен offset после неё - для контрольной точки импорта.
+    """
+    rows = []
+    processed = 0
+    skipped = 0
+    for line, offset in logfiles.iter_lines(path, start, end):
+        processed += 1
+        try:
+            row = parse_import_line(line.decode('utf-8', errors='ignore'))
+        except ValueError:
+            continue
+        if row is None:
+            continue
+        if last_timestamp is not None and row[0] <= last_timestamp:
+            skipped += 1
+            continue
+        rows.append(row + (offset,))
+    return rows, processed, skipped, end
@@ -0,0 +1,243 @@
+"""Суточные разделы сырых записей SquidLog.
+
+Записи хранятся в отдельной таблице на каждые сутки по Москве
+(monitor_squidlog_20240101 и т.д.) со схемой и индексами SquidLog. Срок хранения
+соблюдается удалением целых таблиц - DROP TABLE выполняется мгновенно и не требует
+DELETE по всей таблице, а запросы за период обращаются только к таблицам нужных дней.
+Таблица самой модели SquidLog остаётся для записей, загруженных до появления разделов.
+"""
+import re
+from datetime import date, datetime, timedelta
+from django.apps.registry import Apps
+from django.db import connection, models, DatabaseError
+from django.db.models import Max
+from django.utils import timezone
+from .bulkload import BulkLoader
+from .models import SquidLog
+from .timeutils import local_date, to_timestamp
+
+TABLE_PREFIX = SquidLog._meta.db_table + '_'
+_TABLE_RE = re.compile(re.escape(TABLE_PREFIX) + r'(\d{8})$')
+
+# Модели разделов не попадают в общий реестр приложений (и в миграции)
+_apps = Apps()
+_models = {}
+
+
+def table_name(day):
+    return f'{TABLE_PREFIX}{day:%Y%m%d}'
+
+
+def partition_model(day):
+    """Модель с полями и индексами SquidLog для таблицы суток day (создаётся один раз)"""
+    model = _models.get(day)
+    if model is not None:
+        return model
+
+    suffix = f'{day:%Y%m%d}'
+    meta = type('Meta', (), {
+        'app_label': 'monitor',
+        'apps': _apps,
+        'db_table': table_name(day),
+        'indexes': [
+            models.Index(fields=index.fields, name=f'{index.name}_{suffix}')
+            for index in SquidLog._meta.indexes
+        ],
+    })
+    attrs = {'__module__': __name__, 'Meta': meta}
+    for field in SquidLog._meta.local_fields:
+        attrs[field.name] = field.clone()
+
+    model = _models[day] = type(f'SquidLog{suffix}', (models.Model,), attrs)
+    return model
+
+
+def existing_days():
+    """Даты, для которых есть таблицы разделов, по возрастанию"""
+    days = []
+    for table in connection.introspection.table_names():
+        match = _TABLE_RE.match(table)
+        if match:
+            days.append(datetime.strptime(match.group(1), '%Y%m%d').date())
+    return sorted(days)
+
+
+def ensure_partitions(days):
+    """Создаёт недостающие таблицы разделов; возвращает список созданных дат.
+
+    Вызывается вне транзакции: на SQLite изменение схемы внутри atomic() невозможно.
+    """
+    missing = set(days) - set(existing_days())
+    created = []
+    for day in sorted(missing):
+        try:
+            with connection.schema_editor() as editor:
+                editor.create_model(partition_model(day))
+            created.append(day)
+        except DatabaseError:
+            # Таблицу мог создать параллельный процесс загрузки
+            if day not in existing_days():
+                raise
+    return created
+
+
+def upgrade():
+    """Приводит таблицы разделов к текущей схеме SquidLog: новые колонки и индексы.
+
+    Вызывается при запуске загрузки логов; возвращает число изменений.
+    """
+    changes = 0
+    for day in existing_days():
+        model = partition_model(day)
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+            indexes = connection.introspection.get_constraints(cursor, table)
+
+        expected = {tuple(model._meta.get_field(name).column for name in index.fields) for index in model._meta.indexes}
+        expected |= {(field.column,) for field in model._meta.local_fields if field.db_index}
+        with connection.schema_editor() as editor:
+            for name, info in indexes.items():
+                if info['index'] and not info['primary_key'] and not info['unique'] \
+                        and tuple(info['columns']) not in expected:
+                    editor.execute(f'DROP INDEX {editor.quote_name(name)}')
+                    changes += 1
+            for field in model._meta.local_fields:
+                if field.column not in columns:
+                    editor.add_field(model, field)
+                    changes += 1
+
+        # На SQLite add_field пересоздаёт таблицу вместе с индексами модели
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, table)
+        with connection.schema_editor() as editor:
+            for index in model._meta.indexes:
+                if index.name not in indexes:
+                    editor.add_index(model, index)
+                    changes += 1
+    return changes
+
+
+def drop_before(day):
+    """Удаляет разделы за сутки раньше day; возвращает количество удалённых таблиц"""
+    dropped = 0
+    for partition_day in existing_days():
+        if partition_day >= day:
+            break
+        with connection.schema_editor() as editor:
+            editor.delete_model(partition_model(partition_day))
+        dropped += 1
+    return dropped
+
+
+def day_of(value):
+    """Сутки по Москве для datetime или epoch"""
+    return local_date(to_timestamp(value))
+
+
+def days_between(since=None, until=None):
+    """Существующие разделы, пересекающиеся с периодом [since, until]"""
+    first = day_of(since) if since is not None else date.min
+    last = day_of(until) if until is not None else date.max
+    return [day for day in existing_days() if first <= day <= last]
+
+
+def querysets(since=None, until=None):
+    """QuerySet'ы по разделам за период (от старых суток к новым), уже отфильтрованные по времени"""
+    if isinstance(since, (int, float)):
+        since = datetime.fromtimestamp(since, tz=timezone.utc)
+    if isinstance(until, (int, float)):
+        until = datetime.fromtimestamp(until, tz=timezone.utc)
+
+    result = []
+    for day in days_between(since, until):
+        queryset = partition_model(day).objects.all()
+        if since is not None:
+            queryset = queryset.filter(timestamp__gte=since)
+        if until is not None:
+            queryset = queryset.filter(timestamp__lte=until)
+        result.append(queryset)
+    return result
+
+
+def latest_timestamp():
+    """Время самой свежей записи в разделах или в таблице SquidLog"""
+    for day in reversed(existing_days()):
+        latest = partition_model(day).objects.aggregate(latest=Max('timestamp'))['latest']
+        if latest is not None:
+            return latest
+    return SquidLog.objects.aggregate(latest=Max('timestamp'))['latest']
+
+
+def has_rows():
+    return any(partition_model(day).objects.exists() for day in existing_days()) or SquidLog.objects.exists()
+
+
+def last_activity(since):
+    """{ip: время последней записи} по разделам начиная с since"""
+    result = {}
+    for queryset in querysets(since=since):
+        for row in queryset.order_by().values('client_address').annotate(last=Max('timestamp')):
+            if row['client_address'] not in result or row['last'] > result[row['client_address']]:
+                result[row['client_address']] = row['last']
+    return result
+
+
+def cleanup(days=2):
+    """Удаляет разделы, все записи которых старше days суток"""
+    return drop_before(day_of(timezone.now() - timedelta(days=days)))
+
+
+class PartitionWriter:
+    """Раскладывает кортежи полей SquidLog (см. BulkLoader) по суточным таблицам.
+
+    split() вызывается до транзакции и создаёт недостающие таблицы, write() - внутри
+    транзакции пачки. С bulk вставка идёт через BulkLoader, с defer_indexes у таблиц,
+    созданных в этом запуске, вторичные индексы удаляются и строятся в finish().
+    """
+
+    def __init__(self, bulk=False, defer_indexes=False):
+        self.bulk = bulk
+        self.defer_indexes = defer_indexes
+        self._loaders = {}
+        self._deferred = []
+
+    def _loader(self, day):
+        loader = self._loaders.get(day)
+        if loader is None:
+            loader = self._loaders[day] = BulkLoader(partition_model(day))
+        return loader
+
+    def split(self, rows):
+        """{сутки: строки}; создаёт таблицы для новых суток"""
+        groups = {}
+        for row in rows:
+            groups.setdefault(day_of(row[0]), []).append(row)
+
+        for day in ensure_partitions(groups):
+            if self.defer_indexes:
+                self._loader(day).drop_indexes()
+                self._deferred.append(day)
+        return groups
+
+    def write(self, groups):
+        for day, rows in groups.items():
+            if self.bulk:
+                self._loader(day).load(rows)
+            else:
+                model = partition_model(day)
+                model.objects.bulk_create([
+                    model(timestamp=timestamp, client_address=client_address, result_code=result_code,
+                          bytes=bytes_sent, request_method=request_method, url=url, user_ident=user_ident,
+                          hierarchy_code=hierarchy_code, content_type=content_type, domain=domain)
+                    for (timestamp, client_address, result_code, bytes_sent, request_method, url,
+                         user_ident, hierarchy_code, content_type, domain) in rows
+                ])
+
+    def finish(self):
+        """Строит индексы, отложенные при первичной загрузке; возвращает их количество"""
+        count = 0
+        for day in self._deferred:
+            count += self._loader(day).restore_indexes()
+        self._deferred = []
+        return count
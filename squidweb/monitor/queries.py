@@ -0,0 +1,144 @@
+"""Запросы к базе для представлений: сырые записи SquidLog и агрегаты TrafficRollup.
+
+Сырые записи хранятся двое суток в суточных разделах, поэтому статистика за последние
+24 часа считается по ним через GROUP BY в базе, а более длинные периоды - по агрегатам
+(см. rollups). Файл лога на пути запроса не читается. Результаты - в формате
+статистики aggregation.
+
+Запросы к одной таблице строят функции *_rows(); их планы проверяют тесты
+monitor.tests (manage.py test) - каждый должен читать только покрывающий индекс SquidLog.
+"""
+from datetime import datetime, timezone
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from .domains import url_domain
+from .models import SquidLog
+from . import partitions
+
+# Поля строки подключения для таблиц в представлениях
+CONNECTION_FIELDS = ('timestamp', 'client_address', 'url', 'request_method', 'result_code', 'bytes', 'domain')
+
+
+def raw_querysets(since=None, client_address=None):
+    """QuerySet'ы сырых записей от новых суток к старым; последним - сама таблица SquidLog"""
+    if isinstance(since, (int, float)):
+        since = datetime.fromtimestamp(since, tz=timezone.utc)
+
+    legacy = SquidLog.objects.order_by()
+    if since is not None:
+        legacy = legacy.filter(timestamp__gte=since)
+
+    querysets = list(reversed(partitions.querysets(since=since))) + [legacy]
+    if client_address:
+        querysets = [queryset.filter(client_address=client_address) for queryset in querysets]
+    return querysets
+
+
+def client_rows(queryset):
+    """Запросы и трафик по клиентам"""
+    return queryset.order_by().values('client_address').annotate(requests=Count('id'), traffic=Sum('bytes'))
+
+
+def hour_rows(queryset):
+    """Запросы и трафик по часам"""
+    return (queryset.order_by()
+            .annotate(hour=TruncHour('timestamp', tzinfo=timezone.utc))
+            .values('hour')
+            .annotate(requests=Count('id'), traffic=Sum('bytes')))
+
+
+def domain_rows(queryset):
+    """Запросы и трафик по доменам"""
+    return queryset.order_by().values('domain').annotate(requests=Count('id'), traffic=Sum('bytes'))
+
+
+def _merge(querysets, rows, key):
+    """Складывает строки rows(queryset) всех таблиц: {key(строка): {'requests', 'traffic'}}"""
+    result = {}
+    for queryset in querysets:
+        for row in rows(queryset):
+            stats = result.setdefault(key(row), {'requests': 0, 'traffic': 0})
+            stats['requests'] += row['requests']
+            stats['traffic'] += row['traffic']
+    return result
+
+
+def totals(since, client_address=None):
+    """Общее количество запросов, трафик и число уникальных клиентов по сырым записям"""
+    clients = _merge(raw_querysets(since, client_address), client_rows, lambda row: row['client_address'])
+    return {
+        'requests': sum(stats['requests'] for stats in clients.values()),
+        'traffic': sum(stats['traffic'] for stats in clients.values()),
+        'clients': len(clients),
+    }
+
+
+def by_hour(since, client_address=None):
+    """Статистика по часам по сырым записям: {начало часа (epoch): {...}}, по возрастанию"""
+    hours = _merge(raw_querysets(since, client_address), hour_rows, lambda row: int(row['hour'].timestamp()))
+    return dict(sorted(hours.items()))
+
+
+def by_domain(since, client_address=None):
+    """Статистика по доменам по сырым записям: {домен: {...}}"""
+    return _merge(raw_querysets(since, client_address), domain_rows, lambda row: row['domain'])
+
+
+def connection_row(row):
+    """Строка values() в формате записи лога (время - epoch)"""
+    row = dict(row)
+    row['timestamp'] = row['timestamp'].timestamp()
+    if not row['domain']:
+        # Записи, загруженные до появления колонки domain
+        row['domain'] = url_domain(row['url'])
+    return row
+
+
+class LogRows:
+    """Сырые записи от новых к старым по нескольким таблицам как последовательность для Paginator.
+
+    Срез читает только нужные строки: разделы, целиком попавшие до начала среза,
+    пропускаются по COUNT, остальные - через LIMIT/OFFSET по индексу времени.
+    """
+
+    def __init__(self, querysets, fields=CONNECTION_FIELDS):
+        self.querysets = [queryset.order_by('-timestamp', '-id').values(*fields) for queryset in querysets]
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = sum(queryset.count() for queryset in self.querysets)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            rows = self[item:item + 1]
+            if not rows:
+                raise IndexError(item)
+            return rows[0]
+
+        start, stop = item.start or 0, item.stop
+        rows = []
+        for queryset in self.querysets:
+            if stop is not None and stop <= start:
+                break
+            chunk = [connection_row(row) for row in queryset[start:stop]]
+            rows.extend(chunk)
+            if chunk:
+                skipped = start + len(chunk)
+            elif start:
+                skipped = queryset.count()
+            else:
+                skipped = 0
+            start = max(start - skipped, 0)
+            if stop is not None:
+                stop -= skipped
+        return rows
+
+
+def recent_connections(limit, client_address=None):
+    """Последние limit записей (всех или одного клиента), от новых к старым"""
+    return LogRows(raw_querysets(client_address=client_address))[:limit]
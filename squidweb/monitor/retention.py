@@ -0,0 +1,194 @@
+"""Срок хранения и размер базы: постепенное удаление старых записей.
+
+Записи удаляются пачками по диапазону первичного ключа, каждая пачка - в своей
+короткой транзакции с паузой после неё, поэтому загрузка логов и веб-интерфейс
+не ждут блокировку записи подолгу. Работа ограничена бюджетом времени: что не
+успели за один запуск, будет удалено при следующем (задача Celery beat).
+
+Пороги:
+- возраст: суточные разделы сырых записей старше RAW_RETENTION_DAYS удаляются
+  целиком, агрегаты - по срокам TrafficRollup.expired();
+- размер: если занятый объём базы превысил SQUID_DB_MAX_SIZE, удаляются самые
+  старые сырые записи, пока он не опустится до SQUID_DB_TARGET_SIZE. На PostgreSQL
+  pg_database_size() после DELETE не уменьшается (место возвращает только VACUUM
+  FULL), поэтому там удаляются целиком разделы прошедших суток, от старых к новым.
+
+На SQLite удалённые страницы попадают в список свободных и переиспользуются;
+вернуть их файловой системе по частям позволяет PRAGMA incremental_vacuum в режиме
+auto_vacuum=INCREMENTAL (включается один раз, см. enable_incremental_vacuum).
+"""
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from . import partitions
+from .models import SquidLog, TrafficRollup
+
+RAW_RETENTION_DAYS = 2  # Сырые записи, как и ограничение log_date_constraint
+VACUUM_PAGES = 1000  # Страниц за один шаг incremental_vacuum
+
+SHRINKING_KEY = 'retention_shrinking'  # Уменьшение базы начато, но ещё не закончено
+
+
+def _pragma(cursor, name):
+    cursor.execute(f'PRAGMA {name}')
+    return cursor.fetchone()[0]
+
+
+def used_size():
+    """Занятый данными объём базы в байтах (без свободных страниц SQLite) или None"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            free_pages = _pragma(cursor, 'freelist_count')
+            return (_pragma(cursor, 'page_count') - free_pages) * _pragma(cursor, 'page_size')
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_database_size(current_database())')
+            return cursor.fetchone()[0]
+    return None
+
+
+def enable_incremental_vacuum():
+    """Переводит базу SQLite в режим auto_vacuum=INCREMENTAL; True, если режим включён.
+
+    Для существующей базы режим применяется только полным VACUUM - это делается
+    один раз, дальше место освобождается по частям в incremental_vacuum().
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        if _pragma(cursor, 'auto_vacuum') != 2:
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            cursor.execute('VACUUM')
+        return _pragma(cursor, 'auto_vacuum') == 2
+
+
+def incremental_vacuum(deadline, pages=VACUUM_PAGES):
+    """Возвращает свободные страницы SQLite файловой системе до deadline; возвращает их число"""
+    if connection.vendor != 'sqlite':
+        return 0
+    released = 0
+    with connection.cursor() as cursor:
+        if _pragma(cursor, 'auto_vacuum') != 2:
+            return 0
+        # Хотя бы один шаг, даже если бюджет ушёл на удаление
+        while True:
+            free_pages = _pragma(cursor, 'freelist_count')
+            if not free_pages:
+                break
+            # sqlite3 в execute() делает один шаг - освобождается одна страница;
+            # executescript выполняет прагму до конца
+            connection.connection.executescript(f'PRAGMA incremental_vacuum({pages})')
+            freed = free_pages - _pragma(cursor, 'freelist_count')
+            released += freed
+            if not freed or time.monotonic() >= deadline:
+                break
+    return released
+
+
+def delete_batch(queryset, batch_size):
+    """Удаляет из queryset записи с наименьшими id (не больше batch_size); возвращает их число"""
+    first = queryset.order_by('pk').values_list('pk', flat=True).first()
+    if first is None:
+        return 0
+    with transaction.atomic():
+        return queryset.filter(pk__lt=first + batch_size).delete()[0]
+
+
+def _drain(queryset, deadline, batch_size, pause):
+    """Удаляет записи queryset пачками до deadline; (удалено, удалено ли всё)"""
+    deleted = 0
+    while time.monotonic() < deadline:
+        count = delete_batch(queryset, batch_size)
+        if not count:
+            return deleted, True
+        deleted += count
+        time.sleep(pause)
+    return deleted, False
+
+
+def _shrink_partitions(target_size, stats):
+    """PostgreSQL: удаляет разделы прошедших суток от старых к новым, пока объём больше target_size"""
+    today = partitions.day_of(timezone.now())
+    for day in partitions.existing_days():
+        if day >= today or used_size() <= target_size:
+            break
+        stats['dropped_partitions'] += partitions.drop_before(day + timedelta(days=1))
+    # Остальное - раздел текущих суток и агрегаты, их по размеру не удаляем
+    return True
+
+
+def _shrink(deadline, batch_size, pause, target_size, stats):
+    """Удаляет самые старые сырые записи, пока занятый объём больше target_size"""
+    if connection.vendor == 'postgresql':
+        return _shrink_partitions(target_size, stats)
+
+    today = partitions.day_of(timezone.now())
+    # Сначала записи, загруженные до появления разделов, затем разделы от старых к новым
+    sources = [(None, SquidLog.objects.all())]
+    sources += [(day, partitions.partition_model(day).objects.all()) for day in partitions.existing_days()]
+
+    for day, queryset in sources:
+        while used_size() > target_size:
+            if time.monotonic() >= deadline:
+                return False
+            count = delete_batch(queryset, batch_size)
+            if not count:
+                break
+            stats['deleted_for_size'] += count
+            time.sleep(pause)
+        else:
+            return True
+
+        # Источник опустел: пустую таблицу прошедших суток удаляем целиком
+        if day is not None and day != today:
+            stats['dropped_partitions'] += partitions.drop_before(day + timedelta(days=1))
+    # Сырых записей не осталось - остальной объём занимают агрегаты, удалять больше нечего
+    return True
+
+
+def run(budget=None, batch_size=None, max_size=None, target_size=None, pause=0.05):
+    """Один проход очистки в пределах budget секунд; возвращает статистику.
+
+    complete - всё устаревшее удалено и объём базы в норме; иначе работа
+    продолжится при следующем запуске.
+    """
+    budget = budget or settings.SQUID_RETENTION_BUDGET
+    batch_size = batch_size or settings.SQUID_RETENTION_BATCH_SIZE
+    max_size = max_size or settings.SQUID_DB_MAX_SIZE
+    target_size = min(target_size or settings.SQUID_DB_TARGET_SIZE, max_size)
+    deadline = time.monotonic() + budget
+
+    size_before = used_size()
+    stats = {
+        'size_before': size_before,
+        'dropped_partitions': partitions.cleanup(days=RAW_RETENTION_DAYS),
+        'deleted_expired': 0,
+        'deleted_for_size': 0,
+        'vacuumed_pages': 0,
+        'complete': True,
+    }
+
+    # Срок хранения: сырые записи в самой таблице SquidLog и агрегаты
+    expired = [SquidLog.objects.filter(timestamp__lt=timezone.now() - timedelta(days=RAW_RETENTION_DAYS))]
+    for queryset in expired + TrafficRollup.expired():
+        deleted, done = _drain(queryset, deadline, batch_size, pause)
+        stats['deleted_expired'] += deleted
+        if not done:
+            stats['complete'] = False
+            break
+
+    # Размер: начав уменьшать базу, продолжаем до target_size и в следующих запусках
+    if stats['complete'] and size_before is not None:
+        if size_before > max_size or cache.get(SHRINKING_KEY):
+            shrunk = _shrink(deadline, batch_size, pause, target_size, stats)
+            if shrunk:
+                cache.delete(SHRINKING_KEY)
+            else:
+                cache.set(SHRINKING_KEY, True, None)
+                stats['complete'] = False
+
+    stats['vacuumed_pages'] = incremental_vacuum(deadline)
+    stats['size_after'] = used_size()
+    return stats
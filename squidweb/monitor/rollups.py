@@ -0,0 +1,162 @@
+from datetime import datetime, timezone
+import numpy as np
+from django.db import connection
+from django.db.models import Sum, Max, Count
+from .models import TrafficRollup
+from . import partitions
+from .timeutils import hour_start, day_start, local_date
+
+
+class RollupAccumulator:
+    """Накапливает приращения TrafficRollup в памяти и сбрасывает их одним upsert.
+
+    Пачка строк лога превращается в несколько сотен строк агрегатов, которые
+    прибавляются к уже сохранённым (ON CONFLICT ... DO UPDATE), поэтому импорт
+    может дописывать агрегаты инкрементально.
+    """
+
+    def __init__(self):
+        self._deltas = {}
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def _add(self, key, size, requests=1):
+        delta = self._deltas.get(key)
+        if delta is None:
+            self._deltas[key] = [requests, size]
+        else:
+            delta[0] += requests
+            delta[1] += size
+
+    def add(self, timestamp, client_address, domain, size):
+        self._add(('hour', hour_start(timestamp), client_address, domain), size)
+        self._add(('day', day_start(timestamp), client_address, domain), size)
+
+    def add_columns(self, columns):
+        """Добавляет все записи LogColumns, группируя их по (час, клиент, домен) в NumPy"""
+        if not len(columns):
+            return
+        keys = np.stack([(columns.timestamp // 3600).astype(np.int64), columns.client, columns.domain], axis=1)
+        groups, codes = np.unique(keys, axis=0, return_inverse=True)
+        codes = codes.reshape(-1)
+        requests = np.bincount(codes, minlength=len(groups))
+        traffic = np.bincount(codes, weights=columns.bytes, minlength=len(groups))
+
+        for (hour, client, domain), count, size in zip(groups.tolist(), requests.tolist(), traffic.tolist()):
+            client_address = columns.clients[client]
+            domain = columns.domains[domain]
+            self._add(('hour', hour * 3600, client_address, domain), int(size), count)
+            self._add(('day', day_start(hour * 3600), client_address, domain), int(size), count)
+
+    def flush(self):
+        """Прибавляет накопленные приращения к таблице агрегатов (внутри текущей транзакции)"""
+        if not self._deltas:
+            return 0
+
+        qn = connection.ops.quote_name
+        table = qn(TrafficRollup._meta.db_table)
+        sql = (
+            f'INSERT INTO {table} ({qn("granularity")}, {qn("bucket_start")}, {qn("client_address")}, '
+            f'{qn("domain")}, {qn("requests")}, {qn("bytes")}) VALUES (%s, %s, %s, %s, %s, %s) '
+            f'ON CONFLICT ({qn("granularity")}, {qn("bucket_start")}, {qn("client_address")}, {qn("domain")}) '
+            f'DO UPDATE SET {qn("requests")} = {table}.{qn("requests")} + excluded.{qn("requests")}, '
+            f'{qn("bytes")} = {table}.{qn("bytes")} + excluded.{qn("bytes")}'
+        )
+        adapt = connection.ops.adapt_datetimefield_value
+        rows = [
+            (granularity, adapt(datetime.fromtimestamp(bucket, tz=timezone.utc)), client_address,
+             domain[:255], requests, size)
+            for (granularity, bucket, client_address, domain), (requests, size) in self._deltas.items()
+        ]
+
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+        count = len(rows)
+        self._deltas = {}
+        return count
+
+
+def _period(granularity, since, client_address=None):
+    queryset = TrafficRollup.objects.filter(granularity=granularity, bucket_start__gte=since)
+    if client_address:
+        queryset = queryset.filter(client_address=client_address)
+    return queryset
+
+
+def totals(granularity, since, client_address=None):
+    """Общее количество запросов, трафик и число клиентов за период"""
+    result = _period(granularity, since, client_address).aggregate(
+        requests=Sum('requests'), traffic=Sum('bytes'), clients=Count('client_address', distinct=True)
+    )
+    return {
+        'requests': result['requests'] or 0,
+        'traffic': result['traffic'] or 0,
+        'clients': result['clients'],
+    }
+
+
+def clients(since):
+    """IP-адреса клиентов с активностью начиная с since"""
+    return list(_period('day', since).order_by().values_list('client_address', flat=True).distinct())
+
+
+def by_day(since, client_address=None):
+    """Статистика по дням (дата по Москве): {date: {...}}, по возрастанию даты"""
+    rows = (_period('day', since, client_address)
+            .values('bucket_start')
+            .annotate(requests=Sum('requests'), traffic=Sum('bytes'))
+            .order_by('bucket_start'))
+    return {
+        local_date(row['bucket_start'].timestamp()): {'requests': row['requests'], 'traffic': row['traffic']}
+        for row in rows
+    }
+
+
+def by_domain(granularity, since, client_address=None):
+    """Статистика по доменам: {домен: {...}}"""
+    rows = (_period(granularity, since, client_address)
+            .values('domain')
+            .annotate(requests=Sum('requests'), traffic=Sum('bytes')))
+    return {row['domain']: {'requests': row['requests'], 'traffic': row['traffic']} for row in rows}
+
+
+def users_stats(day_limit, month_limit):
+    """Статистика пользователей: {ip: {'day_traffic', 'month_traffic', 'day_requests',
+    'month_requests', 'last_activity' (epoch)}}.
+
+    Суточные цифры берутся из почасовых агрегатов, месячные - из суточных.
+    last_activity - точное время из сырых записей (суточных разделов), если у клиента есть свежие сырые
+    записи, иначе начало последнего часа с активностью.
+    """
+    day_since = datetime.fromtimestamp(hour_start(day_limit), tz=timezone.utc)
+    month_since = datetime.fromtimestamp(day_start(month_limit), tz=timezone.utc)
+
+    users = {}
+    for row in (_period('day', month_since).values('client_address')
+                .annotate(requests=Sum('requests'), traffic=Sum('bytes'), last_bucket=Max('bucket_start'))):
+        users[row['client_address']] = {
+            'day_traffic': 0,
+            'month_traffic': row['traffic'],
+            'day_requests': 0,
+            'month_requests': row['requests'],
+            'last_activity': row['last_bucket'].timestamp(),
+        }
+
+    for row in (_period('hour', month_since).values('client_address')
+                .annotate(last_bucket=Max('bucket_start'))):
+        if row['client_address'] in users:
+            users[row['client_address']]['last_activity'] = row['last_bucket'].timestamp()
+
+    for client_address, last in partitions.last_activity(day_since).items():
+        if client_address in users:
+            users[client_address]['last_activity'] = last.timestamp()
+
+    for row in (_period('hour', day_since).values('client_address')
+                .annotate(requests=Sum('requests'), traffic=Sum('bytes'))):
+        if row['client_address'] in users:
+            users[row['client_address']]['day_traffic'] = row['traffic']
+            users[row['client_address']]['day_requests'] = row['requests']
+
+    return users
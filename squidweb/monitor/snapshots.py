@@ -0,0 +1,166 @@
+"""Компактные снимки агрегированной статистики в кэше.
+
+Задача refresh_statistics считает статистику по базе (queries, rollups) и кладёт в кэш
+небольшие снимки - списки строк [ключ, запросы, трафик] и итоги, а не записи лога. Снимок
+сериализуется msgpack (JSON, если пакет не установлен) и сжимается zstd (иначе zlib).
+Первый байт хранит формат, поэтому снимок, записанный процессом с другим набором
+пакетов, либо читается, либо считается промахом кэша.
+"""
+import json
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+from . import aggregation, cached, queries, rollups
+from .timeutils import day_start
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+KEY_PREFIX = 'snapshot:'
+TTL = 600
+USER_TTL = 60
+TOP_DOMAINS = 50  # Доменов в снимке главной страницы (на графике - 10)
+PERIODS = {'day': timedelta(hours=24), 'month': timedelta(days=30), 'year': timedelta(days=365)}
+
+# Флаги формата в первом байте
+_MSGPACK = 1
+_ZSTD = 2
+
+
+def pack(value):
+    """Сериализует и сжимает значение из списков, словарей, строк и чисел"""
+    flags = 0
+    if msgpack is not None:
+        data = msgpack.packb(value, use_bin_type=True)
+        flags |= _MSGPACK
+    else:
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+    if zstandard is not None:
+        data = zstandard.ZstdCompressor(level=3).compress(data)
+        flags |= _ZSTD
+    else:
+        data = zlib.compress(data, 6)
+    return bytes([flags]) + data
+
+
+def unpack(data):
+    """Значение из pack(); None, если формат не читается в этом процессе"""
+    flags, data = data[0], data[1:]
+    if (flags & _ZSTD and zstandard is None) or (flags & _MSGPACK and msgpack is None):
+        return None
+
+    data = zstandard.ZstdDecompressor().decompress(data) if flags & _ZSTD else zlib.decompress(data)
+    if flags & _MSGPACK:
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+def cache_items(values):
+    """{имя: снимок} -> {ключ кэша: упакованный снимок} для cached.store_many"""
+    return {KEY_PREFIX + name: pack(value) for name, value in values.items()}
+
+
+def save(name, value, ttl=TTL):
+    cached.store(KEY_PREFIX + name, pack(value), ttl)
+
+
+def _unpack(name, data):
+    try:
+        return unpack(data)
+    except (ValueError, zlib.error) as e:
+        print(f"Error reading snapshot {name}: {e}")
+        return None
+
+
+def get(name, build, ttl=TTL):
+    """Снимок из кэша; устаревший отдаётся, пока build() обновляет его в фоне, при промахе строится сразу"""
+    value = _unpack(name, cached.get(KEY_PREFIX + name, lambda: pack(build()), ttl))
+    if value is None:
+        # Снимок в формате, который этот процесс не читает - перестраиваем
+        value = build()
+        save(name, value, ttl)
+    return value
+
+
+def _rows(stats):
+    return [[key, item['requests'], item['traffic']] for key, item in stats.items()]
+
+
+def dashboard(period, client_address=None):
+    """Снимок за period (day, month, year), всех клиентов или одного: итоги, часы или дни, топ доменов.
+
+    Сутки считаются по сырым записям, длинные периоды - по суточным агрегатам.
+    """
+    time_limit = (timezone.now() - PERIODS[period]).timestamp()
+    if period == 'day':
+        hourly_stats = queries.by_hour(time_limit, client_address)
+        daily_stats = {}
+        domain_stats = queries.by_domain(time_limit, client_address)
+        totals = queries.totals(time_limit, client_address)
+    else:
+        since = datetime.fromtimestamp(day_start(time_limit), tz=dt_timezone.utc)
+        hourly_stats = {}
+        daily_stats = rollups.by_day(since, client_address)
+        domain_stats = rollups.by_domain('day', since, client_address)
+        totals = rollups.totals('day', since, client_address)
+
+    return {
+        'generated_at': time.time(),
+        'totals': [totals['requests'], totals['traffic'], totals['clients']],
+        'hours': _rows(hourly_stats),
+        'days': _rows({day.isoformat(): item for day, item in daily_stats.items()}),
+        'domains': _rows(dict(aggregation.top(domain_stats, TOP_DOMAINS))),
+    }
+
+
+def user(client_address, period):
+    """Снимок пользователя из кэша (на USER_TTL), формат - как у dashboard()"""
+    return get(f'user:{client_address}:{period}', lambda: dashboard(period, client_address), USER_TTL)
+
+
+def users():
+    """Снимок списка пользователей: [ip, трафик и запросы за сутки и месяц, последняя активность]"""
+    now = timezone.now()
+    stats = rollups.users_stats((now - timedelta(hours=24)).timestamp(), (now - timedelta(days=30)).timestamp())
+    return {
+        'generated_at': time.time(),
+        'users': [
+            [ip, item['day_traffic'], item['month_traffic'], item['day_requests'], item['month_requests'],
+             item['last_activity']]
+            for ip, item in stats.items()
+            # Только пользователи с активностью за последние 30 дней
+            if item['month_requests'] > 0
+        ],
+    }
+
+
+def totals(snapshot):
+    requests, traffic, clients = snapshot['totals']
+    return {'requests': requests, 'traffic': traffic, 'clients': clients}
+
+
+def hourly(snapshot):
+    """Часы снимка: {начало часа (epoch): {...}}"""
+    return {hour: {'requests': requests, 'traffic': traffic} for hour, requests, traffic in snapshot['hours']}
+
+
+def daily(snapshot):
+    """Дни снимка: {date: {...}}"""
+    return {
+        date.fromisoformat(day): {'requests': requests, 'traffic': traffic}
+        for day, requests, traffic in snapshot['days']
+    }
+
+
+def domains(snapshot):
+    """Топ доменов снимка: {домен: {...}}"""
+    return {domain: {'requests': requests, 'traffic': traffic} for domain, requests, traffic in snapshot['domains']}
@@ -0,0 +1,496 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from monitor import cached, charts, domains, live, locks, partitions, queries, retention, snapshots
+from monitor.models import ImportCheckpoint, SquidLog, TrafficRollup
+from monitor.timeutils import day_start
+from monitor.utils import SquidLogReader
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def log_line(timestamp, client='192.168.0.1', url='http://example.com/', method='GET', mime='text/html'):
+    """Строка access.log в нативном формате squid"""
+    return f'{timestamp:.3f}    120 {client} TCP_MISS/200 1024 {method} {url} - HIER_DIRECT/10.0.0.1 {mime}\n'
+
+
+def create_rows(model, timestamps, client='192.168.0.1'):
+    """Записи SquidLog (или раздела) с данным временем (epoch) в порядке timestamps"""
+    return model.objects.bulk_create([
+        model(timestamp=datetime.fromtimestamp(timestamp, tz=dt_timezone.utc), client_address=client,
+              result_code='TCP_MISS/200', bytes=1024, request_method='GET', url='http://example.com/',
+              user_ident='-', hierarchy_code='HIER_DIRECT/10.0.0.1', content_type='text/html',
+              domain='example.com')
+        for timestamp in timestamps
+    ])
+
+
+class QueryPlanTests(TransactionTestCase):
+    """Планы запросов (EXPLAIN) к сырым записям: каждый запрос monitor.queries
+    должен использовать свой индекс SquidLog, а не полный просмотр таблицы.
+
+    TransactionTestCase: на SQLite таблицу раздела нельзя создать внутри транзакции.
+    """
+
+    def setUp(self):
+        self.now = timezone.now()
+        # Запросы проверяются на таблице текущих суток (как на самой нагруженной)
+        self.day = partitions.day_of(self.now)
+        partitions.ensure_partitions([self.day])
+        self.model = partitions.partition_model(self.day)
+        self.table = self.model._meta.db_table
+
+        if connection.vendor == 'postgresql':
+            # На маленькой таблице планировщик предпочтёт полный просмотр - запрещаем его
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        partitions.drop_before(self.day + timedelta(days=1))
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def _index_name(self, columns):
+        """Имя индекса таблицы с точно таким набором колонок"""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, self.table)
+        for name, info in constraints.items():
+            if info['index'] and info['columns'] == list(columns):
+                return name
+        return None
+
+    def _uses(self, plan, index, covering):
+        """Использует ли план индекс index (и только его, если covering)"""
+        if connection.vendor == 'postgresql':
+            return f'{"Index Only Scan" if covering else "Scan"} using {index}' in plan
+        return f'{"COVERING INDEX" if covering else "INDEX"} {index}' in plan
+
+    def assertUsesIndex(self, queryset, columns, covering):
+        index = self._index_name(columns)
+        self.assertIsNotNone(index, f'индекс по ({", ".join(columns)}) не найден')
+        plan = queryset.explain()
+        kind = 'покрывающий индекс' if covering else 'индекс'
+        self.assertTrue(self._uses(plan, index, covering), f'ожидался {kind} {index}:\n{plan}')
+
+    def test_query_plans(self):
+        client_address = '192.168.0.1'
+        period = self.model.objects.filter(timestamp__gte=self.now - timedelta(hours=24))
+        client = period.filter(client_address=client_address)
+        time_index = ('timestamp', 'client_address', 'bytes', 'domain')
+        client_index = ('client_address', 'timestamp', 'bytes', 'domain')
+        checks = [
+            # GROUP BY client_address идёт в порядке индекса клиентов без сортировки
+            ('Итоги за период', queries.client_rows(period), client_index, True),
+            ('Трафик по часам', queries.hour_rows(period), time_index, True),
+            ('Топ доменов', queries.domain_rows(period), time_index, True),
+            ('Итоги пользователя', queries.client_rows(client), client_index, True),
+            ('Трафик пользователя по часам', queries.hour_rows(client), client_index, True),
+            ('Домены пользователя', queries.domain_rows(client), client_index, True),
+            ('Последние подключения', queries.LogRows([self.model.objects.all()]).querysets[0][:100],
+             ('timestamp',), False),
+            ('Подключения пользователя',
+             queries.LogRows([self.model.objects.filter(client_address=client_address)]).querysets[0][:25],
+             client_index, False),
+        ]
+        for title, queryset, columns, covering in checks:
+            with self.subTest(title):
+                self.assertUsesIndex(queryset, columns, covering)
+
+
+class ParserTests(SimpleTestCase):
+    """Разбор строк лога: быстрый путь через split должен давать то же, что регулярное выражение"""
+
+    def setUp(self):
+        self.reader = SquidLogReader()
+
+    def test_split_matches_regex(self):
+        lines = [
+            log_line(1700000000.123),
+            log_line(1700000000.5, url='example.com:443', method='CONNECT', mime='-'),
+            log_line(1700000001, url='http://пример.рф/путь?q=1'),
+        ]
+        for line in lines:
+            with self.subTest(line):
+                data = line.encode()
+                self.assertEqual(self.reader._parse_line(data), self.reader._parse_line_regex(line))
+
+    def test_connect_url(self):
+        entry = self.reader._parse_line(log_line(1700000000, url='example.com:443', method='CONNECT').encode())
+        self.assertEqual(entry['url'], 'https://example.com:443')
+
+    def test_regex_fallback(self):
+        # Тип содержимого с пробелом - 11 полей, строку разбирает регулярное выражение
+        line = log_line(1700000000, mime='text/html; charset=utf-8')
+        entry = self.reader._parse_line(line.encode())
+        self.assertEqual(entry, self.reader._parse_line_regex(line))
+        self.assertEqual(entry['mime_type'], 'text/html; charset=utf-8')
+
+    def test_invalid_lines(self):
+        for line in [b'', b'garbage', b'1700000000.0 120 1.2.3.4 TCP_MISS/abc 10 GET http://a/ - HIER_DIRECT/x -']:
+            with self.subTest(line):
+                self.assertIsNone(self.reader._parse_line(line))
+
+
+class DomainTests(SimpleTestCase):
+    """Домен назначения по URL записи лога"""
+
+    def test_url_domain(self):
+        cases = [
+            ('http://example.com/path?q=1', 'example.com'),
+            # CONNECT: и цель host:port, и URL после разбора - один домен
+            ('example.com:443', 'example.com'),
+            ('https://example.com:443', 'example.com'),
+            ('HTTP://WWW.Example.COM./', 'www.example.com'),
+            ('http://user@example.com:8080/', 'example.com'),
+            ('http://[2001:db8::1]:8080/', '2001:db8::1'),
+            ('http://10.0.0.1/', '10.0.0.1'),
+            ('', domains.UNKNOWN),
+        ]
+        for url, domain in cases:
+            with self.subTest(url):
+                self.assertEqual(domains.url_domain(url), domain)
+
+    def test_registrable_domain(self):
+        self.assertEqual(domains.registrable_domain('img.cdn.vk.com'), 'vk.com')
+        self.assertEqual(domains.registrable_domain('news.bbc.co.uk'), 'bbc.co.uk')
+        self.assertEqual(domains.registrable_domain('10.0.0.1'), '10.0.0.1')
+
+
+class SnapshotTests(SimpleTestCase):
+    """Упаковка снимков статистики"""
+
+    value = {'totals': [10, 2048, 3], 'domains': [['пример.рф', 5, 1024.5]], 'generated_at': 1700000000.25}
+
+    def test_round_trip(self):
+        self.assertEqual(snapshots.unpack(snapshots.pack(self.value)), self.value)
+
+    def test_round_trip_without_optional_packages(self):
+        with mock.patch.object(snapshots, 'msgpack', None), mock.patch.object(snapshots, 'zstandard', None):
+            data = snapshots.pack(self.value)
+            self.assertEqual(data[0], 0)
+            self.assertEqual(snapshots.unpack(data), self.value)
+
+    def test_unreadable_format(self):
+        # Снимок, записанный процессом с msgpack и zstd, без них - промах, а не ошибка
+        with mock.patch.object(snapshots, 'msgpack', None), mock.patch.object(snapshots, 'zstandard', None):
+            self.assertIsNone(snapshots.unpack(bytes([snapshots._MSGPACK | snapshots._ZSTD]) + b'data'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedTests(SimpleTestCase):
+    """Кэш представлений: устаревшее значение и одно вычисление на промах"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_miss_and_hit(self):
+        build = mock.Mock(return_value='value')
+        self.assertEqual(cached.get('key', build, 60), 'value')
+        self.assertEqual(cached.get('key', build, 60), 'value')
+        build.assert_called_once()
+
+    def test_stale_while_revalidate(self):
+        cache.set('key', ('old', time.time() - 1))
+        self.assertEqual(cached.get('key', lambda: 'new', 60), 'old')
+
+        # Обновление в фоне записывает новое значение и снимает блокировку
+        lock_key = locks.KEY_PREFIX + cached._lock_name('key')
+        deadline = time.monotonic() + 5
+        while (cache.get('key')[0] != 'new' or cache.get(lock_key)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cache.get('key')[0], 'new')
+        self.assertIsNone(cache.get(lock_key))
+
+    def test_concurrent_misses_build_once(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cached.get('key', build, 60)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+
+class PartitionTestCase(TransactionTestCase):
+    """Тесты с записями лога: таблицы моделей и суточных разделов.
+
+    Миграции monitor создаются при развёртывании и в репозитории не хранятся - таблицы
+    моделей, которых нет в тестовой базе, создаются на время тестов класса. Все таблицы
+    разделов удаляются после каждого теста. TransactionTestCase: на SQLite таблицу
+    нельзя создать внутри транзакции.
+    """
+    models = (SquidLog, TrafficRollup, ImportCheckpoint)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        tables = connection.introspection.table_names()
+        cls.created_models = [model for model in cls.models if model._meta.db_table not in tables]
+        with connection.schema_editor() as editor:
+            for model in cls.created_models:
+                editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.created_models:
+                editor.delete_model(model)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.now = time.time()
+        self.today = partitions.day_of(self.now)
+        self.today_start = day_start(self.now)
+
+    def tearDown(self):
+        partitions.drop_before(date.max)
+
+    def partition(self, timestamp):
+        day = partitions.day_of(timestamp)
+        partitions.ensure_partitions([day])
+        return partitions.partition_model(day)
+
+
+class LogRowsTests(PartitionTestCase):
+    """Срезы LogRows по нескольким таблицам совпадают со срезами общего списка"""
+
+    def setUp(self):
+        super().setUp()
+        # Разделы текущих и прошедших суток и более старые записи в самой таблице SquidLog
+        today = [self.today_start + i for i in range(1, 6)]
+        yesterday = [self.today_start - 60 * i for i in range(1, 8)]
+        legacy = [self.today_start - 3600 - 60 * i for i in range(1, 4)]
+        create_rows(self.partition(today[0]), today)
+        create_rows(self.partition(yesterday[0]), yesterday)
+        create_rows(SquidLog, legacy)
+        self.expected = sorted(today + yesterday + legacy, reverse=True)
+
+    def test_slices(self):
+        rows = queries.LogRows(queries.raw_querysets())
+        self.assertEqual(len(rows), len(self.expected))
+        for start in range(len(self.expected) + 2):
+            for stop in range(start, len(self.expected) + 2):
+                with self.subTest(start=start, stop=stop):
+                    timestamps = [row['timestamp'] for row in rows[start:stop]]
+                    self.assertEqual(timestamps, self.expected[start:stop])
+        self.assertEqual(rows[len(self.expected) - 1]['timestamp'], self.expected[-1])
+        with self.assertRaises(IndexError):
+            rows[len(self.expected)]
+
+    def test_pages(self):
+        paginator = Paginator(queries.LogRows(queries.raw_querysets()), 4)
+        timestamps = [row['timestamp'] for number in paginator.page_range
+                      for row in paginator.page(number).object_list]
+        self.assertEqual(timestamps, self.expected)
+
+    def test_client_filter(self):
+        create_rows(self.partition(self.now), [self.today_start + 10], client='192.168.0.2')
+        rows = queries.LogRows(queries.raw_querysets(client_address='192.168.0.2'))
+        self.assertEqual([row['client_address'] for row in rows[:10]], ['192.168.0.2'])
+
+
+class RetentionTests(PartitionTestCase):
+    """Удаление старых записей пачками по первичному ключу"""
+
+    def setUp(self):
+        super().setUp()
+        self.model = self.partition(self.now)
+        create_rows(self.model, [self.today_start + i for i in range(10)])
+        create_rows(self.model, [self.today_start + i for i in range(5)], client='192.168.0.2')
+
+    def test_delete_batch(self):
+        ids = list(self.model.objects.order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(retention.delete_batch(self.model.objects.all(), 3), 3)
+        self.assertEqual(list(self.model.objects.order_by('pk').values_list('pk', flat=True)), ids[3:])
+
+    def test_delete_batch_respects_queryset(self):
+        queryset = self.model.objects.filter(client_address='192.168.0.2')
+        self.assertEqual(retention.delete_batch(queryset, 100), 5)
+        self.assertEqual(retention.delete_batch(queryset, 100), 0)
+        self.assertEqual(self.model.objects.count(), 10)
+
+    def test_drain(self):
+        deadline = time.monotonic() + 10
+        self.assertEqual(retention._drain(self.model.objects.all(), deadline, 4, 0), (15, True))
+        self.assertFalse(self.model.objects.exists())
+
+    def test_drain_budget(self):
+        # Бюджет исчерпан: ничего не удалено, работа продолжится в следующем запуске
+        self.assertEqual(retention._drain(self.model.objects.all(), time.monotonic(), 4, 0), (0, False))
+        self.assertEqual(self.model.objects.count(), 15)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LivePollTests(PartitionTestCase):
+    """Курсор живой ленты: без повторов при одинаковом времени и с подсчётом пропущенных записей"""
+
+    def setUp(self):
+        super().setUp()
+        self.model = self.partition(self.now)
+        create_rows(self.model, [self.now - 10])
+
+    def test_cursor(self):
+        cursor = live._start_cursor()
+        self.assertEqual(live._poll(*cursor)[:2], ([], 0))
+
+        # Записи с одним временем приходят в разных опросах - каждая ровно один раз
+        created = create_rows(self.model, [self.now - 5] * 3)
+        rows, skipped, *cursor = live._poll(*cursor)
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(row.pk for row in created))
+        self.assertEqual(skipped, 0)
+
+        created = create_rows(self.model, [self.now - 5] * 2)
+        rows, skipped, *cursor = live._poll(*cursor)
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(row.pk for row in created))
+        self.assertEqual(live._poll(*cursor)[:2], ([], 0))
+
+    def test_skipped(self):
+        cursor = live._start_cursor()
+        create_rows(self.model, [self.now - 5 + i / 10 for i in range(8)])
+        with mock.patch.object(live, 'BATCH_SIZE', 3):
+            rows, skipped, *cursor = live._poll(*cursor)
+        # Ленте нужны последние записи: три самые новые по возрастанию, пять пропущено
+        self.assertEqual([round(row['timestamp'], 3) for row in rows],
+                         [round(self.now - 5 + i / 10, 3) for i in range(5, 8)])
+        self.assertEqual(skipped, 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ChartApiTests(PartitionTestCase):
+    """ETag графиков: повторный запрос без изменений получает 304"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_not_modified(self):
+        response = self.client.get('/api/traffic', {'period': 'month'})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get('/api/traffic', {'period': 'month'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get('/api/traffic', {'period': 'year'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_digest_depends_on_period(self):
+        # Одинаковые ряды месяца и года не должны делить ключ в кэше
+        snapshot = {'totals': [0, 0, 0], 'hours': [], 'days': [], 'domains': [['example.com', 1, 10]]}
+        month = charts.render('domains', 'month', snapshot)
+        year = charts.render('domains', 'year', snapshot)
+        self.assertEqual(month[1], year[1])
+        self.assertNotEqual(month[0], year[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImportTests(PartitionTestCase):
+    """import_squid_logs: продолжение по контрольной точке (inode, offset, хэш строки) и ротация"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'access.log')
+        self.timestamp = self.now - 3600
+        self.write('w', 20)
+        self.settings = override_settings(SQUID_LOG_PATH=self.path)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def write(self, mode, count, path=None, tail=''):
+        with open(path or self.path, mode) as f:
+            for _ in range(count):
+                self.timestamp += 1
+                f.write(log_line(self.timestamp))
+            f.write(tail)
+
+    def run_import(self, **options):
+        call_command('import_squid_logs', stdout=StringIO(), **options)
+
+    def count(self):
+        return sum(queryset.count() for queryset in partitions.querysets()) + SquidLog.objects.count()
+
+    def assertCheckpoint(self, offset=None):
+        checkpoint = ImportCheckpoint.objects.get(path=self.path)
+        st = os.stat(self.path)
+        self.assertEqual(checkpoint.inode, st.st_ino)
+        self.assertEqual(checkpoint.offset, st.st_size if offset is None else offset)
+
+    def test_resume(self):
+        self.run_import()
+        self.assertEqual(self.count(), 20)
+        self.assertCheckpoint()
+
+        self.run_import()
+        self.assertEqual(self.count(), 20)
+
+        self.write('a', 5)
+        self.run_import(workers=2)
+        self.assertEqual(self.count(), 25)
+        self.assertCheckpoint()
+
+    def test_partial_line(self):
+        self.run_import()
+        size = os.path.getsize(self.path)
+        # Строка, которую squid ещё не дописал, ждёт следующего запуска
+        self.write('a', 0, tail=log_line(self.timestamp + 1)[:30])
+        self.run_import()
+        self.assertEqual(self.count(), 20)
+        self.assertCheckpoint(size)
+
+    def test_rotation(self):
+        self.run_import()
+        # Хвост, дописанный до ротации, дочитывается из переименованного файла
+        self.write('a', 3)
+        os.rename(self.path, self.path + '.1')
+        self.write('w', 4)
+        self.run_import()
+        self.assertEqual(self.count(), 27)
+        self.assertCheckpoint()
+
+    def test_copytruncate(self):
+        self.run_import()
+        # Файл обрезан и дописан заново: тот же inode, но строка у контрольной точки другая
+        self.write('w', 25)
+        self.run_import()
+        self.assertEqual(self.count(), 45)
+        self.assertCheckpoint()
+
+    def test_bulk(self):
+        self.run_import(bulk=True, batch_size=7)
+        self.assertEqual(self.count(), 20)
+        self.assertCheckpoint()
+        # Индексы, отложенные при первичной загрузке, построены заново
+        model = partitions.partition_model(partitions.day_of(self.timestamp))
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        indexed = [info['columns'] for info in constraints.values() if info['index'] and not info['primary_key']]
+        for index in SquidLog._meta.indexes:
+            self.assertIn(list(index.fields), indexed)
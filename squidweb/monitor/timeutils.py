@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+MOSCOW_TZ = ZoneInfo('Europe/Moscow')
+
+
+def to_datetime(timestamp):
+    """Переводит epoch-время из лога в datetime по Москве (только для отображения)"""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).astimezone(MOSCOW_TZ)
+
+
+def to_timestamp(value):
+    """Приводит границу периода (datetime или epoch) к epoch-времени"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+def hour_start(timestamp):
+    """Начало часа для epoch-времени (смещение Москвы от UTC - целое число часов)"""
+    return timestamp - timestamp % 3600
+
+
+@lru_cache(maxsize=24 * 400)
+def _hour_to_date(hour):
+    return to_datetime(hour * 3600).date()
+
+
+def local_date(timestamp):
+    """Дата по Москве для epoch-времени; datetime создаётся один раз на каждый час"""
+    return _hour_to_date(int(timestamp // 3600))
+
+
+@lru_cache(maxsize=24 * 400)
+def _hour_to_day_start(hour):
+    return to_datetime(hour * 3600).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def day_start(timestamp):
+    """Начало суток по Москве (epoch) для epoch-времени"""
+    return _hour_to_day_start(int(timestamp // 3600))
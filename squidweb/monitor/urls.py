@@ -1,11 +1,18 @@
 from django.urls import path
-from .views import DashboardView, ConnectionsView, UserDetailView, UsersListView
+from .views import (DashboardView, ConnectionsView, UserDetailView, UsersListView,
+                    TrafficApiView, DomainsApiView, UserTrafficApiView, UserDomainsApiView,
+                    ConnectionsStreamView)
 
 app_name = 'monitor'
 
 urlpatterns = [
     path('', DashboardView.as_view(), name='dashboard'),
     path('connections/', ConnectionsView.as_view(), name='connections'),
+    path('connections/stream', ConnectionsStreamView.as_view(), name='connections_stream'),
     path('users/', UsersListView.as_view(), name='users_list'),
     path('user/<str:ip>/', UserDetailView.as_view(), name='user_detail'),
+    path('api/traffic', TrafficApiView.as_view(), name='api_traffic'),
+    path('api/domains', DomainsApiView.as_view(), name='api_domains'),
+    path('api/user/<str:ip>/traffic', UserTrafficApiView.as_view(), name='api_user_traffic'),
+    path('api/user/<str:ip>/domains', UserDomainsApiView.as_view(), name='api_user_domains'),
 ]
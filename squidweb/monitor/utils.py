@@ -1,8 +1,14 @@
 import re
-from datetime import datetime, timezone, timedelta
-from urllib.parse import urlparse
 import os
-from zoneinfo import ZoneInfo
+import mmap
+from itertools import islice
+from .columnar import LogColumnsBuilder
+from .timeutils import MOSCOW_TZ, to_timestamp
+from . import logfiles
+
+# Насколько (сек) запись может нарушать порядок времени в логе: squid пишет строку
+# по завершении запроса, и соседние запросы иногда завершаются не по порядку
+ORDER_SLACK = 60
 
 class SquidLogReader:
     def __init__(self, log_path='/var/log/squid/access.log'):
@@ -10,25 +16,53 @@ class SquidLogReader:
         self.log_pattern = re.compile(
             r'(\d+\.\d+)\s+(\d+)\s+(\S+)\s+(\S+)/(\d+)\s+(\d+)\s+(\S+)\s+(\S+)\s+-\s+(\S+)/(\S+)\s+(.+)'  # Исправленное регулярное выражение
         )
-        self.moscow_tz = ZoneInfo('Europe/Moscow')
+        self.moscow_tz = MOSCOW_TZ
 
     def _parse_line(self, line):
-        """Парсит строку лога и возвращает словарь с данными"""
+        """Парсит строку лога (bytes) и возвращает словарь с данными.
+
+        Быстрый путь - split по пробелам для нативного формата squid из 10 полей,
+        строки другого вида разбираются регулярным выражением. Время остаётся
+        epoch-числом, в datetime его переводит to_datetime() при отображении.
+        """
+        parts = line.split()
+        if len(parts) == 10 and parts[7] == b'-':
+            cache_result, _, status_code = parts[3].partition(b'/')
+            hierarchy, _, server = parts[8].partition(b'/')
+            if status_code.isdigit() and parts[4].isdigit() and server:
+                try:
+                    request_method = parts[5].decode()
+                    url = parts[6].decode('utf-8', errors='ignore')
+                    return {
+                        'timestamp': float(parts[0]),
+                        'response_time': float(parts[1]),
+                        'client_address': parts[2].decode(),
+                        'result_code': int(status_code),
+                        'bytes': int(parts[4]),
+                        'request_method': request_method,
+                        'url': f'https://{url}' if request_method == 'CONNECT' else url,
+                        'cache_result': cache_result.decode(),
+                        'server': server.decode(),
+                        'mime_type': parts[9].decode()
+                    }
+                except ValueError:
+                    pass
+        return self._parse_line_regex(line.decode('utf-8', errors='ignore'))
+
+    def _parse_line_regex(self, line):
+        """Разбирает строку регулярным выражением (проверяющий запасной путь)"""
         try:
             match = self.log_pattern.match(line.strip())
             if match:
                 timestamp, response_time, client_address, cache_result, status_code, bytes_sent, request_method, url, hierarchy, server, mime_type = match.groups()
                 
-                # Преобразуем timestamp в московское время
-                dt = datetime.fromtimestamp(float(timestamp), tz=timezone.utc).astimezone(self.moscow_tz)
-                
                 if request_method == 'CONNECT':
                     clean_url = f'https://{url}'
                 else:
                     clean_url = url
 
                 return {
-                    'timestamp': dt,
+                    'timestamp': float(timestamp),
                     'response_time': float(response_time),
                     'client_address': client_address,
                     'result_code': int(status_code),
@@ -43,58 +77,93 @@ class SquidLogReader:
             print(f"Error parsing line: {line[:100]}... Error: {e}")
         return None
 
+    def _iter_lines_reversed(self, path, block_size=64 * 1024, max_block_size=8 * 1024 * 1024):
+        """Выдаёт строки файла от последней к первой, отображая файл в память (mmap).
+
+        Блок с конца выравнивается по переводу строки через rfind по отображению,
+        копируется только сам блок. Размер блока удваивается с каждым шагом до
+        max_block_size: для последних 100 строк читается 64 КБ, а длинный обратный
+        проход быстро выходит на крупные блоки.
+        """
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = len(mm)
+                while end > 0:
+                    # Начало блока - сразу после перевода строки, чтобы не резать строки
+                    start = mm.rfind(b'\n', 0, max(end - block_size, 0)) + 1
+                    lines = mm[start:end].split(b'\n')
+                    for line in reversed(lines):
+                        yield line
+                    # Блок начинается с начала строки, перевод строки перед ним уже учтён
+                    end = start - 1
+                    block_size = min(block_size * 2, max_block_size)
+
+    def iter_entries(self, since=None, until=None, reverse=False):
+        """Лениво выдаёт разобранные записи лога, не держа файл в памяти.
+
+        since/until - границы по времени (epoch или datetime, включительно), reverse=True - от новых
+        записей к старым. Squid пишет запись по завершении запроса, поэтому соседние
+        строки могут идти не строго по времени: записи вне периода пропускаются, а
+        чтение прекращается только на записи, вышедшей за границу больше чем на
+        ORDER_SLACK секунд. Так запрос за последние сутки не читает весь файл.
+        """
+        since = to_timestamp(since)
+        until = to_timestamp(until)
+
+        if reverse:
+            lines = self._iter_lines_reversed(self.log_path)
+        else:
+            lines = (line for line, _ in logfiles.iter_lines(self.log_path, partial=True))
+
+        for line in lines:
+            if not line.strip():  # Пропускаем пустые строки
+                continue
+            entry = self._parse_line(line)
+            if not entry:
+                continue
+            if since is not None and entry['timestamp'] < since:
+                if reverse and entry['timestamp'] < since - ORDER_SLACK:
+                    break
+                continue
+            if until is not None and entry['timestamp'] > until:
+                if not reverse and entry['timestamp'] > until + ORDER_SLACK:
+                    break
+                continue
+            yield entry
+
+    def read_new_lines(self, inode, offset, limit=None):
+        """Строки, дописанные в лог после offset: [(строка, offset после неё)], не больше limit.
+
+        Режим слежения: вызывающий код хранит inode файла и offset (см. ImportCheckpoint)
+        и передаёт их при каждом вызове, поэтому читаются только новые байты. None - по
+        пути лога уже другой файл (logrotate переименовал его, хвост прежнего ищет
+        logfiles.find_rotated) или файл обрезан (copytruncate). Inode проверяется до и
+        после чтения: если лог сменился между проверкой и открытием, прочитанное
+        отбрасывается. Пустой список - новых строк нет или лог ещё не создан заново.
+        """
+        try:
+            st = os.stat(self.log_path)
+            if st.st_ino != inode or st.st_size < offset:
+                return None
+            lines = list(islice(logfiles.iter_lines(self.log_path, offset), limit))
+            if os.stat(self.log_path).st_ino != inode:
+                return None
+        except FileNotFoundError:
+            return []
+        return lines
+
     def get_last_lines(self, n=10000):
-        """Читает последние n строк из файла"""
+        """Читает последние n строк из файла (n=0 - весь файл)"""
         entries = []
         
         try:
-            with open(self.log_path, 'rb') as f:
-                # Перемещаемся в конец файла
-                f.seek(0, 2)
-                file_size = f.tell()
-                
-                # Читаем файл блоками с конца
-                chunk_size = 8192  # 8KB блоки
-                file_position = file_size
-                lines = []
-                
-                # Продолжаем читать блоки, пока не получим достаточно строк или не дойдем до начала файла
-                while file_position > 0 and (n == 0 or len(lines) < n):
-                    # Определяем размер следующего блока
-                    read_size = min(chunk_size, file_position)
-                    file_position -= read_size
-                    
-                    # Читаем блок
-                    f.seek(file_position)
-                    chunk = f.read(read_size)
-                    
-                    # Добавляем строки из текущего блока
-                    chunk_lines = chunk.decode('utf-8', errors='ignore').splitlines()
-                    
-                    # Если это не первый блок и у нас есть строки,
-                    # первая строка может быть неполной - соединяем ее с последней строкой предыдущего блока
-                    if file_position > 0 and chunk_lines and lines:
-                        # Читаем следующий символ для проверки разделителя строк
-                        f.seek(file_position - 1)
-                        if f.read(1) != b'\n':
-                            lines[0] = chunk_lines[-1] + lines[0]
-                            chunk_lines = chunk_lines[:-1]
-                    
-                    lines = chunk_lines + lines
-                
-                # Обрезаем до нужного количества строк, если указан лимит
-                if n > 0:
-                    lines = lines[-n:]
-                
-                # Парсим строки
-                for line in lines:
-                    if line.strip():  # Пропускаем пустые строки
-                        entry = self._parse_line(line)
-                        if entry:
-                            entries.append(entry)
-                
-                print(f"Successfully parsed {len(entries)} entries from {self.log_path}")
-                
+            if n > 0:
+                entries = list(islice(self.iter_entries(reverse=True), n))
+            else:
+                entries = list(self.iter_entries())
+            print(f"Successfully parsed {len(entries)} entries from {self.log_path}")
         except Exception as e:
             print(f"Error reading log file: {e}")
         
@@ -102,104 +171,31 @@ class SquidLogReader:
         entries.sort(key=lambda x: x['timestamp'])
         return entries
 
-    def get_user_connections(self, ip_address, limit=500):
-        """Получает соединения конкретного пользователя"""
-        entries = self.get_last_lines(n=0)  # Читаем весь файл
-        connections = []
-        
-        for entry in entries:
-            if entry['client_address'] == ip_address:
-                connections.append(entry)
-                if len(connections) >= limit:
-                    break
-        
-        return connections
+    def _parse_file(self, path):
+        """Разбирает файл лога целиком (в том числе сжатый .gz/.bz2/.zst) в LogColumns"""
+        builder = LogColumnsBuilder()
+        with logfiles.open_log(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = self._parse_line(line)
+                    if entry:
+                        builder.append_entry(entry)
+        return builder.build()
 
-    def get_active_users(self, hours=24):
-        """Получает список активных пользователей за последние N часов"""
-        users = {}
-        min_timestamp = datetime.now(self.moscow_tz) - timedelta(hours=hours)
-        
-        entries = self.get_last_lines(n=0)  # Читаем весь файл
-        
-        for entry in entries:
-            if entry['timestamp'] >= min_timestamp:
-                ip = entry['client_address']
-                if ip not in users:
-                    users[ip] = {'requests': 0, 'bytes': 0, 'last_activity': None}
-                
-                users[ip]['requests'] += 1
-                users[ip]['bytes'] += entry['bytes']
-                
-                if not users[ip]['last_activity'] or entry['timestamp'] > users[ip]['last_activity']:
-                    users[ip]['last_activity'] = entry['timestamp']
-        
-        return users
-
-    def get_traffic_stats(self, hours=24):
-        """Получает статистику трафика за указанное количество часов"""
-        stats = {
-            'total_requests': 0,
-            'total_bytes': 0,
-            'hourly_stats': {},
-            'daily_stats': {},
-            'monthly_stats': {},
-            'status_codes': {},
-            'users': {},
-            'domains': {}
-        }
-        
-        min_timestamp = datetime.now(self.moscow_tz) - timedelta(hours=hours)
-        month_limit = datetime.now(self.moscow_tz) - timedelta(days=30)
-        
-        entries = self.get_last_lines(n=0)  # Читаем весь файл
-        
-        for entry in entries:
-            if entry['timestamp'] >= min_timestamp:
-                stats['total_requests'] += 1
-                stats['total_bytes'] += entry['bytes']
-                
-                hour = entry['timestamp'].replace(minute=0, second=0, microsecond=0)
-                if hour not in stats['hourly_stats']:
-                    stats['hourly_stats'][hour] = {'requests': 0, 'bytes': 0}
-                stats['hourly_stats'][hour]['requests'] += 1
-                stats['hourly_stats'][hour]['bytes'] += entry['bytes']
-                
-                status = entry['result_code']
-                stats['status_codes'][status] = stats['status_codes'].get(status, 0) + 1
-                
-                ip = entry['client_address']
-                if ip not in stats['users']:
-                    stats['users'][ip] = {'requests': 0, 'bytes': 0}
-                stats['users'][ip]['requests'] += 1
-                stats['users'][ip]['bytes'] += entry['bytes']
-                
-                try:
-                    if entry['request_method'] == 'CONNECT':
-                        domain = entry['url'].split(':')[0]
-                    else:
-                        domain = urlparse(entry['url']).netloc
-                    if domain:
-                        stats['domains'][domain] = stats['domains'].get(domain, 0) + 1
-                except:
-                    pass
-            
-            if entry['timestamp'] >= month_limit:
-                day = entry['timestamp'].date()
-                if day not in stats['daily_stats']:
-                    stats['daily_stats'][day] = {'requests': 0, 'bytes': 0}
-                stats['daily_stats'][day]['requests'] += 1
-                stats['daily_stats'][day]['bytes'] += entry['bytes']
-                
-                month = entry['timestamp'].replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                if month not in stats['monthly_stats']:
-                    stats['monthly_stats'][month] = {'requests': 0, 'bytes': 0}
-                stats['monthly_stats'][month]['requests'] += 1
-                stats['monthly_stats'][month]['bytes'] += entry['bytes']
-        
-        # Сортируем статистику по времени
-        stats['hourly_stats'] = dict(sorted(stats['hourly_stats'].items()))
-        stats['daily_stats'] = dict(sorted(stats['daily_stats'].items()))
-        stats['monthly_stats'] = dict(sorted(stats['monthly_stats'].items()))
-        
-        return stats
+    def iter_rotated_columns(self, since=None, cache_dir=None, workers=1):
+        """Выдаёт (путь, LogColumns) для ротированных копий лога от старых к новым.
+
+        Файлы, последний раз изменённые раньше since, не открываются вовсе. С cache_dir
+        каждый файл распаковывается и разбирается один раз (см. logfiles.load_columns),
+        разные файлы разбираются в пуле из workers процессов.
+        """
+        from .parallel import map_ordered, parse_rotated
+
+        paths = logfiles.rotated_files(self.log_path)
+        logfiles.cleanup_artifacts(cache_dir, paths)
+        if since is not None:
+            paths = [path for path in paths if os.path.getmtime(path) >= since]
+
+        tasks = [(self.log_path, path, cache_dir, since) for path in paths]
+        for path, columns in zip(paths, map_ordered(parse_rotated, tasks, workers)):
+            yield path, columns
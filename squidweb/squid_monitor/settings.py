@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+from importlib.util import find_spec
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -10,6 +11,7 @@ DEBUG = True
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '192.168.101.0/24', '*']
 
 INSTALLED_APPS = [
+    'django.contrib.staticfiles',
     'monitor',
 ]
 
@@ -57,8 +59,29 @@ TIME_ZONE = 'Europe/Moscow'
 USE_I18N = True
 USE_TZ = True
 
+
+
+def plotly_static_dir():
+    """Каталог с plotly.min.js установленного пакета plotly (версия совпадает с
+    requirements.txt) или None. Пакет не импортируется - только ищется его путь,
+    поэтому сбой или отсутствие plotly не ломают загрузку настроек."""
+    try:
+        spec = find_spec('plotly')
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    path = os.path.join(list(spec.submodule_search_locations)[0], 'package_data')
+    return path if os.path.isfile(os.path.join(path, 'plotly.min.js')) else None
+
+
 STATIC_URL = 'static/'
-STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATICFILES_DIRS = [
+    os.path.join(BASE_DIR, 'static'),
+]
+PLOTLY_STATIC_DIR = plotly_static_dir()
+if PLOTLY_STATIC_DIR:
+    STATICFILES_DIRS.append(('plotly', PLOTLY_STATIC_DIR))
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -70,6 +93,18 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # Настройки для Squid Monitor
 SQUID_LOG_DIR = '/var/log/squid'  # Директория с логами
 SQUID_LOG_PATH = os.path.join(SQUID_LOG_DIR, 'access.log')  # Путь к текущему логу
+SQUID_PARSE_WORKERS = os.cpu_count() or 1  # Процессов для первичного разбора большого лога
+SQUID_PARSE_CACHE_DIR = BASE_DIR / 'parse_cache'  # Разобранные ротированные логи (.npz)
+SQUID_DOMAIN_FOLDING = False  # Сворачивать поддомены до регистрируемого домена (img.cdn.vk.com -> vk.com)
+SQUID_DNS_WORKERS = 16  # Потоков для обратного разрешения IP клиентов
+SQUID_DNS_TIMEOUT = 0.5  # Сколько секунд страница ждёт имена, которых нет в кэше
+SQUID_DNS_TTL = 24 * 3600  # Срок хранения имени хоста в кэше
+SQUID_DNS_NEGATIVE_TTL = 3600  # Срок хранения неудачного ответа
+SQUID_VIEW_WORKERS = 16  # Потоков на процесс для работы асинхронных представлений с базой и кэшем
+SQUID_DB_MAX_SIZE = 800 * 1024 * 1024  # Занятый объём базы, после которого удаляются старые записи
+SQUID_DB_TARGET_SIZE = 700 * 1024 * 1024  # До какого объёма уменьшать базу
+SQUID_RETENTION_BUDGET = 20  # Секунд на один проход очистки (monitor.retention)
+SQUID_RETENTION_BATCH_SIZE = 5000  # Записей, удаляемых одной транзакцией
 
 # Cache settings
 CACHES = {
@@ -98,21 +133,17 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Europe/Moscow'
 CELERY_BEAT_SCHEDULE = {
-    'update-log-cache': {
-        'task': 'monitor.tasks.update_log_cache',
+    'refresh-statistics': {
+        'task': 'monitor.tasks.refresh_statistics',
         'schedule': 300.0,  # каждые 5 минут
     },
-    'generate-traffic-charts': {
-        'task': 'monitor.tasks.generate_traffic_charts',
-        'schedule': 300.0,  # каждые 5 минут
-    },
-    'generate-domain-charts': {
-        'task': 'monitor.tasks.generate_domain_charts',
-        'schedule': 300.0,  # каждые 5 минут
+    'refresh-hostnames': {
+        'task': 'monitor.tasks.refresh_hostnames',
+        'schedule': 6 * 3600.0,  # каждые 6 часов, раньше истечения SQUID_DNS_TTL
     },
-    'update-users-cache': {
-        'task': 'monitor.tasks.update_users_cache',
-        'schedule': 300.0,  # каждые 5 минут
+    'apply-retention': {
+        'task': 'monitor.tasks.apply_retention',
+        'schedule': 600.0,  # каждые 10 минут
     },
 }
 
@@ -1,9 +1,16 @@
 from django.urls import path
-from monitor.views import DashboardView, ConnectionsView, UsersListView, UserDetailView
+from monitor.views import (DashboardView, ConnectionsView, UsersListView, UserDetailView,
+                           TrafficApiView, DomainsApiView, UserTrafficApiView, UserDomainsApiView,
+                           ConnectionsStreamView)
 
 urlpatterns = [
     path('', DashboardView.as_view(), name='dashboard'),
     path('connections/', ConnectionsView.as_view(), name='connections'),
+    path('connections/stream', ConnectionsStreamView.as_view(), name='connections_stream'),
     path('users/', UsersListView.as_view(), name='users'),
     path('user/<str:ip>/', UserDetailView.as_view(), name='user_detail'),
+    path('api/traffic', TrafficApiView.as_view(), name='api_traffic'),
+    path('api/domains', DomainsApiView.as_view(), name='api_domains'),
+    path('api/user/<str:ip>/traffic', UserTrafficApiView.as_view(), name='api_user_traffic'),
+    path('api/user/<str:ip>/domains', UserDomainsApiView.as_view(), name='api_user_domains'),
 ]
@@ -1,4 +1,4 @@
 #!/bin/bash
 echo "Запуск сервера с Gunicorn..."
-gunicorn squid_monitor.wsgi:application --workers 4 --threads 2 --bind 0.0.0.0:8000 --daemon
+gunicorn squid_monitor.asgi:application --worker-class uvicorn.workers.UvicornWorker --workers 4 --bind 0.0.0.0:8000 --daemon
 echo "Сервер запущен на http://localhost:8000"
@@ -0,0 +1,88 @@
+// Графики страниц по рядам из JSON API (monitor.charts). Элемент графика:
+// <div data-chart="traffic|domains" data-url="/api/..."></div>; если данных нет,
+// скрывается ближайший .chart-row.
+(function () {
+    'use strict';
+
+    var LAYOUT = {
+        paper_bgcolor: 'white',
+        plot_bgcolor: 'white',
+        font: {color: '#2a3f5f'},
+        hoverlabel: {bgcolor: 'white', font: {size: 12, family: 'Rockwell'}}
+    };
+    var AXIS = {gridcolor: '#EBF0F8', zerolinecolor: '#EBF0F8', automargin: true};
+
+    function axis(options) {
+        return Object.assign({}, AXIS, options);
+    }
+
+    function trafficFigure(data) {
+        var byDate = data.axis === 'Дата';
+        return {
+            data: [{
+                type: 'scatter',
+                mode: 'lines',
+                x: data.labels,
+                y: data.traffic,
+                hovertemplate: data.axis + ': %{x}<br>Трафик: %{y:.2s}B<extra></extra>'
+            }],
+            layout: Object.assign({}, LAYOUT, {
+                title: {text: data.title},
+                xaxis: axis({title: {text: data.axis}, type: 'category', tickangle: byDate ? 45 : 'auto'}),
+                yaxis: axis({title: {text: 'Трафик'}, tickformat: '.2s'}),
+                margin: {b: byDate ? 80 : 50}
+            })
+        };
+    }
+
+    function domainsFigure(data) {
+        return {
+            data: [{
+                type: 'bar',
+                orientation: 'h',
+                x: data.requests,
+                y: data.domains,
+                customdata: data.traffic,
+                hovertemplate: 'Домен: %{y}<br>Запросов: %{x}<br>Трафик: %{customdata:.2s}B<extra></extra>'
+            }],
+            layout: Object.assign({}, LAYOUT, {
+                title: {text: data.title},
+                xaxis: axis({title: {text: 'Количество запросов'}}),
+                yaxis: axis({title: {text: 'Домен'}, type: 'category'}),
+                margin: {l: 200}
+            })
+        };
+    }
+
+    var FIGURES = {traffic: trafficFigure, domains: domainsFigure};
+
+    function hide(element) {
+        var row = element.closest('.chart-row');
+        (row || element).hidden = true;
+    }
+
+    function render(element) {
+        fetch(element.dataset.url, {credentials: 'same-origin'})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            })
+            .then(function (data) {
+                var figure = FIGURES[element.dataset.chart](data);
+                if (!figure.data[0].x.length) {
+                    hide(element);
+                    return;
+                }
+                Plotly.newPlot(element, figure.data, figure.layout, {responsive: true});
+            })
+            .catch(function () {
+                element.textContent = 'Не удалось загрузить график';
+            });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('[data-chart]').forEach(render);
+    });
+})();
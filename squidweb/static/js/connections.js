@@ -0,0 +1,106 @@
+// Живая лента подключений: новые строки приходят по SSE (monitor.live) и добавляются
+// в начало таблицы; в таблице остаётся не больше data-limit строк. Событие skipped -
+// записи, не попавшие в ленту, - отмечается строкой-разрывом.
+(function () {
+    'use strict';
+
+    function statusClass(status) {
+        if (status === 'TCP_MISS/200') {
+            return 'bg-success';
+        }
+        if (status.indexOf('4') !== -1) {
+            return 'bg-warning';
+        }
+        if (status.indexOf('5') !== -1) {
+            return 'bg-danger';
+        }
+        return 'bg-info';
+    }
+
+    function cell(row, content) {
+        var td = document.createElement('td');
+        if (content !== undefined) {
+            td.textContent = content;
+        }
+        row.appendChild(td);
+        return td;
+    }
+
+    function buildRow(event) {
+        var row = document.createElement('tr');
+        cell(row, event.time);
+
+        var ip = cell(row);
+        if (event.ip) {
+            var link = document.createElement('a');
+            link.href = event.user_url;
+            link.className = 'text-decoration-none';
+            link.textContent = event.ip;
+            ip.appendChild(link);
+        } else {
+            ip.textContent = '-';
+        }
+
+        cell(row, event.hostname);
+        cell(row, event.domain);
+
+        var url = document.createElement('div');
+        url.className = 'text-truncate';
+        url.style.maxWidth = '300px';
+        url.title = event.url;
+        url.textContent = event.url;
+        cell(row).appendChild(url);
+
+        cell(row, event.method);
+
+        var badge = document.createElement('span');
+        badge.className = 'badge ' + statusClass(event.status);
+        badge.textContent = event.status;
+        cell(row).appendChild(badge);
+
+        cell(row, event.size);
+        return row;
+    }
+
+    function buildGap(event, columns) {
+        var row = document.createElement('tr');
+        row.className = 'table-secondary';
+        var td = cell(row, 'Пропущено записей: ' + event.skipped + ' (слишком много за раз)');
+        td.colSpan = columns;
+        td.className = 'text-center text-muted small';
+        return row;
+    }
+
+    function prepend(body, row, limit) {
+        body.insertBefore(row, body.firstChild);
+        while (body.rows.length > limit) {
+            body.deleteRow(-1);
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var body = document.querySelector('tbody[data-stream]');
+        if (!body || !window.EventSource) {
+            return;
+        }
+        var status = document.getElementById('stream-status');
+        var limit = parseInt(body.dataset.limit, 10) || 100;
+        var source = new EventSource(body.dataset.stream);
+
+        source.onopen = function () {
+            status.textContent = 'в реальном времени';
+            status.className = 'badge bg-success ms-2';
+        };
+        source.onerror = function () {
+            status.textContent = 'переподключение...';
+            status.className = 'badge bg-warning ms-2';
+        };
+        source.onmessage = function (message) {
+            prepend(body, buildRow(JSON.parse(message.data)), limit);
+        };
+        source.addEventListener('skipped', function (message) {
+            var columns = body.closest('table').tHead.rows[0].cells.length;
+            prepend(body, buildGap(JSON.parse(message.data), columns), limit);
+        });
+    });
+})();